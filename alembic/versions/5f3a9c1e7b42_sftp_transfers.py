@@ -0,0 +1,38 @@
+"""SFTP Transfers.
+
+Revision ID: 5f3a9c1e7b42
+Revises: d2d36306e779
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5f3a9c1e7b42"
+down_revision = "d2d36306e779"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create sftp_transfers table."""
+    op.create_table(
+        "sftp_transfers",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("host", sa.String, nullable=False),
+        sa.Column("path", sa.String, nullable=False),
+        sa.Column("size", sa.BigInteger, nullable=False),
+        sa.Column("mtime", sa.BigInteger, nullable=False),
+        sa.Column("checksum", sa.String, nullable=False),
+        sa.Column("last_updated", sa.DateTime),
+    )
+    op.create_index("ix_sftp_transfers_host_path", "sftp_transfers", ["host", "path"])
+
+
+def downgrade() -> None:
+    """Drop sftp_transfers table."""
+    op.drop_index("ix_sftp_transfers_host_path", table_name="sftp_transfers")
+    op.drop_table("sftp_transfers")
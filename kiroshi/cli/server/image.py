@@ -1,10 +1,58 @@
 """Sets up CLI for the Image Server."""
 
+import json
+import os
+from pathlib import Path
+
 import click
 import uvicorn
 
+from kiroshi.settings import settings
+
 
 @click.command(name="image")
-def image() -> None:
+@click.option("-w", "--workers", default=settings.image_server_workers, show_default=True, help="Number of worker processes.")
+@click.option("--loop", default=settings.image_server_loop, show_default=True, type=click.Choice(["auto", "asyncio", "uvloop"]), help="Event loop implementation.")
+@click.option("--http", default=settings.image_server_http, show_default=True, type=click.Choice(["auto", "h11", "httptools"]), help="HTTP protocol implementation.")
+@click.option("--timeout-keep-alive", default=settings.image_server_timeout_keep_alive, show_default=True, help="Seconds to keep idle client connections open.")
+@click.option("--backlog", default=settings.image_server_backlog, show_default=True, help="Maximum number of pending connections.")
+@click.option("--limit-concurrency", default=settings.image_server_limit_concurrency, type=int, help="Maximum concurrent connections per worker before responding with 503.")
+@click.option("--timeout-graceful-shutdown", default=settings.image_server_timeout_graceful_shutdown, type=int, help="Seconds to wait for in-flight requests on shutdown.")
+@click.option("--prefetch", multiple=True, default=settings.image_server_prefetch, show_default=True, help="Fill the cache from a container or prefix before reporting ready, as container:prefix.")
+@click.option("--prefetch-keys", default=settings.image_server_prefetch_keys, type=click.Path(exists=True, dir_okay=False, path_type=Path), help="File of container:blob lines, hottest first, to prefetch.")
+@click.option("--prefetch-concurrency", default=settings.image_server_prefetch_concurrency, show_default=True, help="Number of blobs prefetched at once.")
+def image(
+    workers: int,
+    loop: str,
+    http: str,
+    timeout_keep_alive: int,
+    backlog: int,
+    limit_concurrency: int | None,
+    timeout_graceful_shutdown: int | None,
+    prefetch: tuple[str, ...],
+    prefetch_keys: Path | None,
+    prefetch_concurrency: int,
+) -> None:
     """Run the image server."""
-    uvicorn.run("kiroshi.server.image.server:app", host="0.0.0.0", port=6502)  # noqa: S104
+    # The server reads these from settings, which worker processes load from the environment.
+    settings.image_server_workers = workers
+    settings.image_server_prefetch = list(prefetch)
+    settings.image_server_prefetch_keys = prefetch_keys
+    settings.image_server_prefetch_concurrency = prefetch_concurrency
+    os.environ["IMAGE_SERVER_WORKERS"] = str(workers)
+    os.environ["IMAGE_SERVER_PREFETCH"] = json.dumps(settings.image_server_prefetch)
+    os.environ["IMAGE_SERVER_PREFETCH_CONCURRENCY"] = str(prefetch_concurrency)
+    if prefetch_keys is not None:
+        os.environ["IMAGE_SERVER_PREFETCH_KEYS"] = str(prefetch_keys)
+    uvicorn.run(
+        "kiroshi.server.image.server:app",
+        host="0.0.0.0",  # noqa: S104
+        port=6502,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=timeout_keep_alive,
+        backlog=backlog,
+        limit_concurrency=limit_concurrency,
+        timeout_graceful_shutdown=timeout_graceful_shutdown,
+    )
@@ -1,5 +1,7 @@
 """Blob command."""
 
+from pathlib import Path
+
 import click
 
 from kiroshi.storage.blob import Blob
@@ -16,7 +18,92 @@ from kiroshi.storage.blob import Blob
     "--destination",
     help="Destination Storage Location, format: <blob|sftp|nfs>:<container_name>:<directory_name>",
 )
-def blob(source: str, destination: str) -> None:
+@click.option(
+    "--server-side/--streamed",
+    default=True,
+    show_default=True,
+    help="Have Blob Storage copy blobs between accounts itself, or download and re-upload them through this process.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    default=8,
+    show_default=True,
+    help="Number of blobs moved at once.",
+)
+@click.option(
+    "--max-inflight-bytes",
+    default=256 * 1024 * 1024,
+    show_default=True,
+    help="Maximum size of all blobs being copied through this process at once.",
+)
+@click.option(
+    "--block-size",
+    default=8 * 1024 * 1024,
+    show_default=True,
+    help="Blobs larger than this are copied through this process in blocks of this size.",
+)
+@click.option(
+    "--block-concurrency",
+    default=4,
+    show_default=True,
+    help="Number of blocks of a single blob copied at once.",
+)
+@click.option(
+    "-m",
+    "--mode",
+    default="move",
+    show_default=True,
+    type=click.Choice(["move", "sync"]),
+    help="move: copy every blob and delete the source. sync: keep sources and only copy new or changed blobs.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="File recording transferred blobs, so an interrupted run can be resumed.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Report what would be transferred without transferring anything.",
+)
+@click.option(
+    "--list-concurrency",
+    default=4,
+    show_default=True,
+    help="Number of sub-directories of the source directory listed at once.",
+)
+def blob(
+    source: str,
+    destination: str,
+    concurrency: int,
+    max_inflight_bytes: int,
+    block_size: int,
+    block_concurrency: int,
+    mode: str,
+    checkpoint: Path | None,
+    list_concurrency: int,
+    *,
+    server_side: bool,
+    dry_run: bool,
+) -> None:
     """Azure Blob Storage Commands."""
-    blob = Blob(source=source, destination=destination)
+    blob = Blob(
+        source=source,
+        destination=destination,
+        server_side=server_side,
+        concurrency=concurrency,
+        max_inflight_bytes=max_inflight_bytes,
+        block_size=block_size,
+        block_concurrency=block_concurrency,
+        mode=mode,
+        checkpoint=checkpoint,
+        dry_run=dry_run,
+        list_concurrency=list_concurrency,
+    )
     blob.run()
+    if dry_run:
+        click.echo(f"Would transfer {blob.transferred} blobs ({blob.transferred_bytes} bytes), {blob.skipped} already up to date")
+    if blob.failed:
+        msg = f"{len(blob.failed)} blobs could not be moved"
+        raise click.ClickException(msg)
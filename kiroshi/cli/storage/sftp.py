@@ -4,6 +4,7 @@ from pathlib import Path
 
 import click
 
+from kiroshi.settings import settings
 from kiroshi.storage.sftp import SFTP
 
 
@@ -51,7 +52,101 @@ from kiroshi.storage.sftp import SFTP
     help="Enable Provider Specific Hacks",
     type=click.Choice(["mastercard", "mastercard_testing", "wasabi"]),
 )
-def sftp(host: str, port: int, user: str, key: Path, path: Path, blob_path: str, hacks: str) -> None:
+@click.option(
+    "-c",
+    "--concurrency",
+    default=4,
+    show_default=True,
+    help="Number of files transferred at once, each over its own SFTP channel.",
+)
+@click.option(
+    "--block-size",
+    default=8 * 1024 * 1024,
+    show_default=True,
+    help="Size of the blocks files are streamed to Blob Storage in.",
+)
+@click.option(
+    "--block-concurrency",
+    default=4,
+    show_default=True,
+    help="Number of blocks of a single file uploaded at once.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Skip files already ingested with the same size and mtime, as recorded in the database.",
+)
+@click.option(
+    "--window-size",
+    default=settings.sftp_window_size,
+    show_default=True,
+    help="SSH channel window size, raise it on high-latency links.",
+)
+@click.option(
+    "--max-packet-size",
+    default=settings.sftp_max_packet_size,
+    show_default=True,
+    help="Largest SSH packet the server may send.",
+)
+@click.option(
+    "--keepalive",
+    default=settings.sftp_keepalive,
+    show_default=True,
+    help="Seconds between SSH keepalives, 0 to disable.",
+)
+@click.option(
+    "--compression/--no-compression",
+    default=settings.sftp_compression,
+    show_default=True,
+    help="Request SSH compression.",
+)
+@click.option(
+    "--cipher",
+    "ciphers",
+    multiple=True,
+    default=settings.sftp_ciphers,
+    help="Cipher to prefer, may be given several times in order of preference.",
+)
+@click.option(
+    "--prefetch-requests",
+    default=settings.sftp_prefetch_requests,
+    type=int,
+    help="Read requests in flight per file, unlimited if not set.",
+)
+@click.option(
+    "--connect-attempts",
+    default=settings.sftp_connect_attempts,
+    show_default=True,
+    help="Attempts to connect before giving up.",
+)
+@click.option(
+    "--connect-wait",
+    default=settings.sftp_connect_wait,
+    show_default=True,
+    help="Seconds between connection attempts.",
+)
+def sftp(
+    host: str,
+    port: int,
+    user: str,
+    key: Path,
+    path: Path,
+    blob_path: str,
+    hacks: str,
+    concurrency: int,
+    block_size: int,
+    block_concurrency: int,
+    window_size: int,
+    max_packet_size: int,
+    keepalive: int,
+    ciphers: tuple[str, ...],
+    prefetch_requests: int | None,
+    connect_attempts: int,
+    connect_wait: float,
+    *,
+    incremental: bool,
+    compression: bool,
+) -> None:
     """Third-Party SFTP Commands."""
     s = SFTP(
         sftp_host=host,
@@ -61,5 +156,20 @@ def sftp(host: str, port: int, user: str, key: Path, path: Path, blob_path: str,
         sftp_path=path,
         blob_path=blob_path,
         hacks=hacks,
+        concurrency=concurrency,
+        block_size=block_size,
+        block_concurrency=block_concurrency,
+        incremental=incremental,
+        window_size=window_size,
+        max_packet_size=max_packet_size,
+        keepalive=keepalive,
+        compression=compression,
+        ciphers=list(ciphers),
+        prefetch_requests=prefetch_requests,
+        connect_attempts=connect_attempts,
+        connect_wait=connect_wait,
     )
     s.run()
+    if s.failed:
+        msg = f"{len(s.failed)} files could not be transferred"
+        raise click.ClickException(msg)
@@ -3,13 +3,14 @@
 It defines the following models:
 - FrontDoorRanges
 - FrontDoorIPs
+- SFTPTransfers
 
 Each model represents a table in the database and is defined using SQLAlchemy.
 """
 
 from datetime import datetime
 
-from sqlalchemy import ARRAY, String, create_engine
+from sqlalchemy import ARRAY, BigInteger, Index, String, create_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, declarative_base, mapped_column
 
 from kiroshi.settings import settings
@@ -37,3 +38,18 @@ class FrontDoorIPs(Base):
     domain: Mapped[str | None]
     ips: Mapped[list[str] | None] = mapped_column(ARRAY(String))
     last_updated: Mapped[datetime | None]
+
+
+class SFTPTransfers(Base):
+    """Model representing the ledger of files ingested from SFTP Servers."""
+
+    __tablename__ = "sftp_transfers"
+    __table_args__ = (Index("ix_sftp_transfers_host_path", "host", "path"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    host: Mapped[str]
+    path: Mapped[str]
+    size: Mapped[int] = mapped_column(BigInteger)
+    mtime: Mapped[int] = mapped_column(BigInteger)
+    checksum: Mapped[str]
+    last_updated: Mapped[datetime | None]
@@ -1,21 +1,79 @@
 """Healthchecking Components for Kiroshi Servers."""
 
-from azure.storage.blob.aio import BlobServiceClient
+import asyncio
+import contextlib
+
 from fastapi import APIRouter, status
 from fastapi.responses import JSONResponse
+from loguru import logger
 
+from kiroshi.server.common.storage import BlobClientPool
 from kiroshi.settings import settings
 
 
 class Healthchecks:
     """Healthcheck Class."""
 
-    def __init__(self) -> None:
-        """Initialize the Healthchecks class."""
+    def __init__(
+        self,
+        blob_clients: BlobClientPool,
+        interval: float = settings.readiness_interval,
+        timeout: float = settings.readiness_timeout,
+    ) -> None:
+        """Initialize the Healthchecks class.
+
+        Args:
+            blob_clients (BlobClientPool): Shared Blob Storage clients.
+            interval (float): Seconds between readiness checks.
+            timeout (float): Seconds before a readiness check is considered failed.
+
+        """
+        self.blob_clients = blob_clients
+        self.interval = interval
+        self.timeout = timeout
+        self.error: str | None = "readiness has not been checked yet"
+        self._task: asyncio.Task | None = None
+        self._startup: list[tuple[asyncio.Task, str]] = []
         self.router = APIRouter()
         self.router.add_api_route("/livez", self.livez, response_class=JSONResponse)
         self.router.add_api_route("/readyz", self.readyz, response_class=JSONResponse)
 
+    async def check(self) -> None:
+        """Check that required services are working and store the result."""
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self.blob_clients.get().get_account_information()
+        except Exception as e:  # noqa: BLE001
+            error = str(e) or type(e).__name__
+            if error != self.error:
+                logger.warning("Readiness check failed", error=error)
+            self.error = error
+        else:
+            if self.error is not None:
+                logger.info("Readiness check passed")
+            self.error = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start checking readiness in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop checking readiness."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def wait_for(self, task: asyncio.Task, reason: str) -> None:
+        """Report not ready with the given reason until a startup task has finished."""
+        self._startup.append((task, reason))
+
     async def livez(self) -> JSONResponse:
         """Return an immediate 204 response."""
         return JSONResponse(
@@ -24,17 +82,13 @@ class Healthchecks:
         )
 
     async def readyz(self) -> JSONResponse:
-        """Return a response if required services are working."""
-        client = BlobServiceClient.from_connection_string(settings.blob_storage_account_dsn)
-        async with client:
-            try:
-                blob_client = client.get_blob_client(container="test", blob="test")
-                await blob_client.download_blob()
-            except Exception as e:  # noqa: BLE001
-                return JSONResponse(
-                    content={"error": str(e)},
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+        """Return the result of the most recent readiness check, or why startup has not finished."""
+        error = next((reason for task, reason in self._startup if not task.done()), self.error)
+        if error is not None:
+            return JSONResponse(
+                content={"error": error},
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
         return JSONResponse(
             content={"status": "ok"},
             status_code=status.HTTP_200_OK,
@@ -0,0 +1,136 @@
+"""Prometheus Metrics Components for Kiroshi Servers."""
+
+import os
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Seconds the request being served has spent waiting on Blob Storage, unset outside of requests
+_upstream: ContextVar[list[float] | None] = ContextVar("kiroshi_upstream", default=None)
+
+
+class Metrics:
+    """Metrics Class.
+
+    When the server runs multiple worker processes, set PROMETHEUS_MULTIPROC_DIR to a directory shared by all
+    workers so that every scrape reports the sum across workers rather than whichever worker answered.
+    """
+
+    def __init__(self, registry: CollectorRegistry | None = None, max_containers: int = 100) -> None:
+        """Initialize the Metrics class.
+
+        Args:
+            registry (CollectorRegistry): Registry to publish metrics to, defaults to a new registry.
+            max_containers (int): Number of distinct containers to label, further containers are counted as "other".
+
+        """
+        self.registry = registry or CollectorRegistry()
+        self.max_containers = max_containers
+        self._containers: set[str] = set()
+        self.router = APIRouter()
+        self.router.add_api_route("/metrics", self.metrics, response_class=Response)
+
+        self.duration = Histogram(
+            "kiroshi_server_duration_seconds",
+            "Time spent per stage: total request, waiting on Blob Storage including body transfers, and sending the response body.",
+            ["stage"],
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+            registry=self.registry,
+        )
+        self.in_flight = Gauge("kiroshi_server_requests_in_flight", "Requests currently being served.", multiprocess_mode="livesum", registry=self.registry)
+        self.responses = Counter("kiroshi_server_responses_total", "Responses sent, per container and status code.", ["container", "status"], registry=self.registry)
+        self.bytes_served = Counter("kiroshi_server_response_bytes_total", "Response body bytes sent, per container.", ["container"], registry=self.registry)
+        self.cache_requests = Counter("kiroshi_server_cache_requests_total", "Cache lookups by result.", ["result"], registry=self.registry)
+
+    async def metrics(self) -> Response:
+        """Return metrics in the Prometheus exposition format."""
+        registry = self.registry
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+    def container(self, name: str) -> str:
+        """Return the label to use for a container, bounding the number of distinct labels."""
+        if name in self._containers:
+            return name
+        if len(self._containers) < self.max_containers:
+            self._containers.add(name)
+            return name
+        return "other"
+
+    @contextmanager
+    def upstream(self) -> Iterator[None]:
+        """Add the time spent in the block to the upstream time of the request being served.
+
+        Calls made outside of a request, such as readiness checks, index refreshes and prefetching, are not recorded.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            waited = _upstream.get()
+            if waited is not None:
+                waited[0] += time.perf_counter() - started
+
+    async def upstream_chunks(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Yield chunks of a download, adding the time spent waiting for each one to the upstream time of the request."""
+        while True:
+            with self.upstream():
+                chunk = await anext(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class MetricsMiddleware:
+    """ASGI Middleware recording request metrics for paths under a prefix."""
+
+    def __init__(self, app: ASGIApp, metrics: Metrics, prefix: str = "/content/") -> None:
+        """Initialize the MetricsMiddleware class."""
+        self.app = app
+        self.metrics = metrics
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve a request, recording its duration, status and size."""
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        container = self.metrics.container(next((value.decode("latin-1") for key, value in scope["headers"] if key == b"container"), ""))
+        started = time.perf_counter()
+        sending = None
+        status = 500
+        size = 0
+
+        async def wrapped(message: Message) -> None:
+            nonlocal sending, status, size
+            if message["type"] == "http.response.start":
+                sending = time.perf_counter()
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        waited = [0.0]
+        token = _upstream.set(waited)
+        self.metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, wrapped)
+        finally:
+            finished = time.perf_counter()
+            _upstream.reset(token)
+            self.metrics.in_flight.dec()
+            self.metrics.duration.labels(stage="total").observe(finished - started)
+            if waited[0]:
+                self.metrics.duration.labels(stage="upstream").observe(waited[0])
+            if sending is not None:
+                self.metrics.duration.labels(stage="send").observe(finished - sending)
+            self.metrics.responses.labels(container=container, status=str(status)).inc()
+            self.metrics.bytes_served.labels(container=container).inc(size)
@@ -0,0 +1,80 @@
+"""Shared Azure Blob Storage Clients for Kiroshi Servers."""
+
+from typing import Any
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob.aio import BlobServiceClient
+
+from kiroshi.settings import settings
+
+
+class BlobClientPool:
+    """Long-lived pool of async BlobServiceClients, one per Storage Account.
+
+    Clients share keep-alive connections between requests, so connection-string parsing and TLS handshakes
+    only happen once per connection rather than once per request.
+    """
+
+    def __init__(
+        self,
+        connection_limit: int = settings.image_server_connection_limit,
+        connection_limit_per_host: int = settings.image_server_connection_limit_per_host,
+        keepalive_timeout: float = settings.image_server_keepalive_timeout,
+        **client_options: Any,  # noqa: ANN401
+    ) -> None:
+        """Initialize the BlobClientPool class.
+
+        Args:
+            connection_limit (int): Total number of simultaneous connections per Storage Account, 0 for unlimited.
+            connection_limit_per_host (int): Number of simultaneous connections per endpoint, 0 for unlimited.
+            keepalive_timeout (float): Seconds to keep idle connections open.
+            **client_options: Passed to every BlobServiceClient, such as raw_request_hook and raw_response_hook.
+
+        """
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.client_options = client_options
+        self._clients: dict[str, BlobServiceClient] = {}
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+
+    def get(self, dsn: str | None = None) -> BlobServiceClient:
+        """Return the client for a Storage Account, creating it on first use.
+
+        Must be called from within a running event loop.
+
+        Args:
+            dsn (str): Storage Account Connection String, defaults to the blob storage account.
+
+        Returns:
+            BlobServiceClient
+
+        """
+        dsn = dsn or settings.blob_storage_account_dsn
+        if dsn not in self._clients:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    limit_per_host=self.connection_limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                # the SDK decodes Content-Encoding itself, as in the session azure-core creates
+                auto_decompress=False,
+            )
+            self._sessions[dsn] = session
+            self._clients[dsn] = BlobServiceClient.from_connection_string(
+                dsn,
+                transport=AioHttpTransport(session=session, session_owner=False),
+                **self.client_options,
+            )
+        return self._clients[dsn]
+
+    async def close(self) -> None:
+        """Close all clients and their underlying connections."""
+        for client in self._clients.values():
+            await client.close()
+        for session in self._sessions.values():
+            await session.close()
+        self._clients.clear()
+        self._sessions.clear()
@@ -0,0 +1,433 @@
+"""Caches for the Image Hosting Service."""
+
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO
+
+from loguru import logger
+
+from kiroshi.settings import settings
+
+# A blob name, or a (blob, kind, parameters) tuple for content derived from a blob, which no blob name can be equal to
+Key = str | tuple[str, ...]
+
+
+def _append(fo: BinaryIO, chunk: bytes) -> None:
+    """Write a chunk and flush it, so it can be read back before the file is closed."""
+    fo.write(chunk)
+    fo.flush()
+
+
+def _running(pid: int) -> bool:
+    """Return True if a process with the given ID is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass(slots=True)
+class CachedBlob:
+    """A cached copy of a blob at a specific ETag."""
+
+    etag: str
+    last_modified: datetime
+    content: bytes
+    expires: float = field(default=0.0)
+
+    @property
+    def size(self) -> int:
+        """Return the size of the blob in bytes."""
+        return len(self.content)
+
+    @property
+    def fresh(self) -> bool:
+        """Return True if the entry can be served without revalidating against Blob Storage."""
+        return time.monotonic() < self.expires
+
+
+@dataclass(slots=True)
+class DiskBlob:
+    """A copy of a blob at a specific ETag stored on local disk."""
+
+    etag: str
+    last_modified: datetime
+    size: int
+    path: Path
+    expires: float = field(default=0.0)
+
+    @property
+    def fresh(self) -> bool:
+        """Return True if the entry can be served without revalidating against Blob Storage."""
+        return time.monotonic() < self.expires
+
+
+class DiskWrite:
+    """A blob being written to the disk cache by a single download.
+
+    Requests follow the file as it grows rather than waiting for the download to finish. The download runs in
+    its own task, so the blob is still cached if every request following it disconnects.
+    """
+
+    def __init__(self, path: Path, etag: str, last_modified: datetime, size: int | None, chunk_size: int) -> None:
+        """Initialize the DiskWrite class.
+
+        Args:
+            path (Path): Temporary file the blob is written to.
+            etag (str): ETag of the blob being written.
+            last_modified (datetime): Last-Modified of the blob being written.
+            size (int): Expected size of the blob, None if it is not known until the download finishes.
+            chunk_size (int): Size of reads when following the file.
+
+        """
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        self.chunk_size = chunk_size
+        self.written = 0
+        self.finished = False
+        self.entry: DiskBlob | None = None
+        self.error: Exception | None = None
+        self.task: asyncio.Task | None = None
+        self._progress = asyncio.Condition()
+
+    async def advance(self, size: int) -> None:
+        """Record that more of the blob has been written."""
+        async with self._progress:
+            self.written += size
+            self._progress.notify_all()
+
+    async def finish(self, entry: DiskBlob | None, error: Exception | None) -> None:
+        """Record that the write finished, with its cache entry or the error that stopped it."""
+        async with self._progress:
+            self.entry = entry
+            self.error = error
+            self.finished = True
+            self._progress.notify_all()
+
+    async def wait(self) -> DiskBlob:
+        """Wait for the blob to be written, returning its cache entry or raising the error that stopped the download."""
+        async with self._progress:
+            await self._progress.wait_for(lambda: self.finished)
+        if self.error is not None:
+            raise self.error
+        return self.entry
+
+    async def read(self) -> AsyncIterator[bytes]:
+        """Yield the blob's content as it is written."""
+        try:
+            fo = await asyncio.to_thread(self.path.open, "rb")
+        except FileNotFoundError:
+            # The write finished, and the file was moved into place or removed, before this request started reading
+            fo = await asyncio.to_thread((await self.wait()).path.open, "rb")
+        try:
+            offset = 0
+            while True:
+                if offset < self.written:
+                    chunk = await asyncio.to_thread(fo.read, min(self.chunk_size, self.written - offset))
+                    offset += len(chunk)
+                    yield chunk
+                    continue
+                if self.error is not None:
+                    raise self.error
+                if self.finished:
+                    return
+                async with self._progress:
+                    await self._progress.wait_for(lambda: self.written > offset or self.finished)  # noqa: B023
+        finally:
+            await asyncio.to_thread(fo.close)
+
+
+class MemoryCache:
+    """Bounded in-process LRU cache of blob contents.
+
+    Entries are stored per container and blob alongside the ETag they were downloaded at. Once an entry's TTL
+    has passed it is still returned so the caller can revalidate it against that ETag rather than download it again.
+    Content derived from a blob is stored under a tuple key instead of the blob name.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = settings.image_server_cache_max_bytes,
+        max_entry_bytes: int = settings.image_server_cache_max_entry_bytes,
+        ttl: float = settings.image_server_cache_ttl,
+    ) -> None:
+        """Initialize the MemoryCache class.
+
+        Args:
+            max_bytes (int): Total size of all cached blobs, 0 disables the cache.
+            max_entry_bytes (int): Blobs larger than this are never cached.
+            ttl (float): Seconds an entry is served before it is revalidated.
+
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl = ttl
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, Key], CachedBlob] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of cached blobs."""
+        return len(self._entries)
+
+    def cacheable(self, size: int) -> bool:
+        """Return True if a blob of the given size may be cached."""
+        return size <= self.max_entry_bytes
+
+    def get(self, container: str, blob: Key) -> CachedBlob | None:
+        """Return the cached entry for a blob, marking it as recently used."""
+        key = (container, blob)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, container: str, blob: Key, etag: str, last_modified: datetime, content: bytes) -> CachedBlob | None:
+        """Cache a blob, evicting the least recently used entries to stay within budget.
+
+        Returns the new entry, or None if the blob is too large to cache.
+        """
+        if not self.cacheable(len(content)):
+            return None
+        self.discard(container, blob)
+        entry = CachedBlob(etag=etag, last_modified=last_modified, content=content)
+        self.refresh(entry)
+        self._entries[(container, blob)] = entry
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.content)
+        return entry
+
+    def refresh(self, entry: CachedBlob) -> None:
+        """Restart an entry's TTL after it has been revalidated."""
+        entry.expires = time.monotonic() + self.ttl
+
+    def discard(self, container: str, blob: Key) -> None:
+        """Remove a blob from the cache if present."""
+        entry = self._entries.pop((container, blob), None)
+        if entry is not None:
+            self.size -= len(entry.content)
+
+
+class DiskCache:
+    """Bounded LRU cache of blob contents on local disk, intended for a pod's emptyDir volume.
+
+    Files are named after a hash of the container, blob and ETag, with a JSON sidecar holding the metadata
+    required to serve them. Existing files are picked up on startup and revalidated on first use, so a
+    restarted container does not need to download its working set again. The index is only modified from
+    the event loop, all file access happens in worker threads.
+
+    Each process only knows about the files it wrote, so server worker processes sharing a path each keep their
+    cache in a subdirectory named after their process ID, with an equal share of max_bytes. Subdirectories of
+    workers that are no longer running are removed on startup.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = settings.image_server_disk_cache_max_bytes,
+        max_entry_bytes: int = settings.image_server_disk_cache_max_entry_bytes,
+        ttl: float = settings.image_server_cache_ttl,
+        chunk_size: int = 1024 * 1024,
+        workers: int = settings.image_server_workers,
+    ) -> None:
+        """Initialize the DiskCache class.
+
+        Args:
+            path (Path): Directory to store cached blobs in.
+            max_bytes (int): Total size of all cached blobs.
+            max_entry_bytes (int): Blobs larger than this are never cached.
+            ttl (float): Seconds an entry is served before it is revalidated.
+            chunk_size (int): Size of reads when serving byte ranges.
+            workers (int): Number of server worker processes sharing path.
+
+        """
+        self._prune(path)
+        if workers > 1:
+            path = path / f"worker-{os.getpid()}"
+            max_bytes //= workers
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, Key], DiskBlob] = OrderedDict()
+        self._writes: dict[tuple[str, Key], DiskWrite] = {}
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        """Return the number of cached blobs."""
+        return len(self._entries)
+
+    @staticmethod
+    def _prune(path: Path) -> None:
+        """Remove the subdirectories of worker processes that are no longer running."""
+        for directory in path.glob("worker-*"):
+            pid = directory.name.removeprefix("worker-")
+            if not (pid.isascii() and pid.isdigit()) or (int(pid) != os.getpid() and not _running(int(pid))):
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _load(self) -> None:
+        """Index files left behind by a previous process, least recently written first."""
+        for tmp in self.path.glob("*.tmp"):
+            tmp.unlink(missing_ok=True)
+        for sidecar in sorted(self.path.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            data = sidecar.with_suffix("")
+            try:
+                metadata = json.loads(sidecar.read_text())
+                entry = DiskBlob(
+                    etag=metadata["etag"],
+                    last_modified=datetime.fromisoformat(metadata["last_modified"]),
+                    size=metadata["size"],
+                    path=data,
+                )
+                valid = data.stat().st_size == entry.size
+            except (OSError, ValueError, KeyError):
+                valid = False
+            if not valid:
+                sidecar.unlink(missing_ok=True)
+                data.unlink(missing_ok=True)
+                continue
+            blob = metadata["blob"]
+            self._insert(metadata["container"], blob if isinstance(blob, str) else tuple(blob), entry)
+        logger.info("Loaded Disk Cache", path=str(self.path), entries=len(self), size=self.size)
+
+    def _digest(self, container: str, blob: Key, etag: str) -> str:
+        return hashlib.sha256(json.dumps([container, blob, etag]).encode()).hexdigest()
+
+    def _insert(self, container: str, blob: Key, entry: DiskBlob) -> None:
+        key = (container, blob)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size
+            if previous.path != entry.path:
+                self._remove(previous)
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self._remove(evicted)
+
+    def _remove(self, entry: DiskBlob) -> None:
+        entry.path.unlink(missing_ok=True)
+        entry.path.with_suffix(".json").unlink(missing_ok=True)
+
+    def _commit(self, tmp: Path, container: str, blob: Key, etag: str, last_modified: datetime, size: int) -> DiskBlob:
+        """Move a completed temporary file into place and write its metadata."""
+        data = self.path / self._digest(container, blob, etag)
+        tmp.replace(data)
+        metadata = {"container": container, "blob": blob, "etag": etag, "last_modified": last_modified.isoformat(), "size": size}
+        data.with_suffix(".json").write_text(json.dumps(metadata))
+        return DiskBlob(etag=etag, last_modified=last_modified, size=size, path=data)
+
+    def _tmp(self) -> Path:
+        return self.path / f"{secrets.token_hex(16)}.tmp"
+
+    def cacheable(self, size: int) -> bool:
+        """Return True if a blob of the given size may be cached."""
+        return size <= self.max_entry_bytes
+
+    def get(self, container: str, blob: Key) -> DiskBlob | None:
+        """Return the cached entry for a blob, marking it as recently used."""
+        key = (container, blob)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def writing(self, container: str, blob: Key) -> DiskWrite | None:
+        """Return the write in progress for a blob, if any."""
+        return self._writes.get((container, blob))
+
+    def refresh(self, entry: DiskBlob) -> None:
+        """Restart an entry's TTL after it has been revalidated."""
+        entry.expires = time.monotonic() + self.ttl
+
+    def discard(self, container: str, blob: Key) -> None:
+        """Remove a blob from the cache if present."""
+        entry = self._entries.pop((container, blob), None)
+        if entry is not None:
+            self.size -= entry.size
+            self._remove(entry)
+
+    async def put(self, container: str, blob: Key, etag: str, last_modified: datetime, content: bytes) -> DiskBlob | None:
+        """Write a blob to the cache.
+
+        Returns the new entry, or None if the blob is too large to cache.
+        """
+        if not self.cacheable(len(content)):
+            return None
+        tmp = self._tmp()
+        await asyncio.to_thread(tmp.write_bytes, content)
+        entry = await asyncio.to_thread(self._commit, tmp, container, blob, etag, last_modified, len(content))
+        self.refresh(entry)
+        self._insert(container, blob, entry)
+        return entry
+
+    async def write(self, container: str, blob: Key, etag: str, last_modified: datetime, size: int | None, chunks: AsyncIterable[bytes]) -> DiskWrite:
+        """Start writing a blob to the cache in the background from a stream of chunks.
+
+        The blob is only added to the cache once every chunk has been written, if the download fails the partial
+        file is removed. Returns once the file has been created, so it can be followed as it is written.
+        """
+        write = DiskWrite(path=self._tmp(), etag=etag, last_modified=last_modified, size=size, chunk_size=self.chunk_size)
+        fo = await asyncio.to_thread(write.path.open, "wb")
+        self._writes[(container, blob)] = write
+        write.task = asyncio.create_task(self._write(container, blob, write, fo, chunks))
+        return write
+
+    async def _write(self, container: str, blob: Key, write: DiskWrite, fo: BinaryIO, chunks: AsyncIterable[bytes]) -> None:
+        entry = error = None
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(_append, fo, chunk)
+                await write.advance(len(chunk))
+            await asyncio.to_thread(fo.close)
+            entry = await asyncio.to_thread(self._commit, write.path, container, blob, write.etag, write.last_modified, write.written)
+            self.refresh(entry)
+            self._insert(container, blob, entry)
+        except Exception as e:  # noqa: BLE001
+            error = e
+            logger.warning("Disk Cache write failed", container=container, blob=str(blob), error=str(e))
+        finally:
+            if entry is None:
+                await asyncio.to_thread(fo.close)
+                write.path.unlink(missing_ok=True)
+                error = error or RuntimeError("Disk Cache write was cancelled")
+            if self._writes.get((container, blob)) is write:
+                del self._writes[(container, blob)]
+            await write.finish(entry, error)
+
+    async def read(self, entry: DiskBlob, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        """Yield an inclusive byte range of a cached blob."""
+        end = entry.size - 1 if end is None else end
+        fo = await asyncio.to_thread(entry.path.open, "rb")
+        try:
+            await asyncio.to_thread(fo.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(fo.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(fo.close)
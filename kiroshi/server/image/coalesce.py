@@ -0,0 +1,49 @@
+"""Request Coalescing for the Image Hosting Service."""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Share a single in-flight call between concurrent callers with the same key.
+
+    The call runs in its own task, so a caller disconnecting does not cancel the work for everyone else
+    waiting on it. Results and exceptions are delivered to every caller.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the SingleFlight class."""
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._calls)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller has gone away.
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Run fn, or wait for an identical call already in flight.
+
+        Args:
+            key (Hashable): Identifies calls that can be shared.
+            fn (Callable): Coroutine function to run if no call is in flight.
+
+        Returns:
+            tuple[T, bool]: The result of the call, and True if this caller started it.
+
+        """
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), leader
@@ -0,0 +1,61 @@
+"""Response Compression for the Image Hosting Service."""
+
+import gzip
+
+import brotli
+
+ENCODINGS = {
+    "br": ".br",
+    "gzip": ".gz",
+}
+COMPRESSIBLE = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+def compressible(mimetype: str) -> bool:
+    """Return True if content of this type benefits from compression."""
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Pick the best content coding the client accepts, preferring brotli over gzip.
+
+    Args:
+        accept_encoding (str): Accept-Encoding request header.
+
+    Returns:
+        str | None: Content coding name, or None to send the content uncompressed.
+
+    """
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        weight = 1.0
+        for name, _, value in (param.partition("=") for param in params):
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    for coding in ENCODINGS:
+        if weights.get(coding, weights.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Return the ETag of a blob's content after compression with the given coding."""
+    source = etag.strip('"')
+    return f'"{source}-{encoding}"'
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    """Compress content with the given coding."""
+    if encoding == "br":
+        return brotli.compress(content, quality=9)
+    return gzip.compress(content, compresslevel=9, mtime=0)
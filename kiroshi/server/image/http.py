@@ -0,0 +1,89 @@
+"""HTTP Helpers for the Image Hosting Service."""
+
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def http_date(value: datetime) -> str:
+    """Format a datetime as an HTTP-date."""
+    return format_datetime(value.astimezone(UTC), usegmt=True)
+
+
+def not_modified(etag: str, last_modified: datetime, if_none_match: str | None, if_modified_since: str | None) -> bool:
+    """Evaluate If-None-Match and If-Modified-Since preconditions as per RFC 9110.
+
+    Args:
+        etag (str): Current ETag of the blob.
+        last_modified (datetime): Current modification time of the blob.
+        if_none_match (str): If-None-Match request header.
+        if_modified_since (str): If-Modified-Since request header.
+
+    Returns:
+        bool: True if the client's copy is current and a 304 should be returned.
+
+    """
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = etag.removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == current for tag in if_none_match.split(","))
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def if_range_matches(etag: str, last_modified: datetime, if_range: str | None) -> bool:
+    """Evaluate an If-Range precondition, returning True if the Range header should be honoured."""
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return if_range == http_date(last_modified)
+
+
+def _digits(value: str) -> bool:
+    """Return True if value is empty or only ASCII digits, which int() is guaranteed to accept."""
+    return value.isascii() and (not value or value.isdigit())
+
+
+def parse_range(header: str, size: int, max_ranges: int = 16) -> list[tuple[int, int]] | None:
+    """Parse a Range header into a list of inclusive byte offsets as per RFC 9110.
+
+    Args:
+        header (str): Range request header.
+        size (int): Size of the blob in bytes.
+        max_ranges (int): Requests for more ranges than this are served in full.
+
+    Returns:
+        list[tuple[int, int]] | None: Satisfiable ranges, an empty list if none are satisfiable, or None if the
+            header is malformed and should be ignored.
+
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    specs = specs.split(",")
+    if len(specs) > max_ranges:
+        return None
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition("-")
+        if not sep or not (first or last) or not _digits(first) or not _digits(last):
+            return None
+        if not first:
+            suffix = int(last)
+            if suffix > 0 and size > 0:
+                ranges.append((max(size - suffix, 0), size - 1))
+            continue
+        start, end = int(first), int(last) if last else size - 1
+        if last and end < start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    return ranges
@@ -0,0 +1,141 @@
+"""Blob Index for the Image Hosting Service."""
+
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from loguru import logger
+
+from kiroshi.server.common.storage import BlobClientPool
+from kiroshi.settings import settings
+
+
+@dataclass(slots=True)
+class IndexedBlob:
+    """The properties of a blob as of the last listing."""
+
+    etag: str
+    last_modified: datetime
+    size: int
+    content_type: str | None
+
+
+class BlobIndex:
+    """In-memory listing of blobs per container, so requests for blobs that do not exist never reach Blob Storage.
+
+    Indexed containers are listed in full on startup and re-listed in the background, applying each page as it
+    arrives and dropping deleted blobs once a listing completes. Until a container's first listing completes
+    its requests go to Blob Storage as normal. Blobs uploaded since the last listing are reported missing until
+    the next one, so the refresh interval bounds how long a new upload can 404.
+
+    Blobs found missing in containers that are not indexed are remembered for a short time instead.
+    """
+
+    def __init__(
+        self,
+        blob_clients: BlobClientPool,
+        containers: list[str] = settings.image_server_index_containers,
+        interval: float = settings.image_server_index_interval,
+        negative_ttl: float = settings.image_server_negative_ttl,
+        negative_max_entries: int = settings.image_server_negative_max_entries,
+    ) -> None:
+        """Initialize the BlobIndex class.
+
+        Args:
+            blob_clients (BlobClientPool): Shared Blob Storage clients.
+            containers (list[str]): Containers to index.
+            interval (float): Seconds between listings of each container.
+            negative_ttl (float): Seconds to remember a missing blob in containers that are not indexed, 0 to disable.
+            negative_max_entries (int): Maximum number of missing blobs to remember.
+
+        """
+        self.blob_clients = blob_clients
+        self.containers = containers
+        self.interval = interval
+        self.negative_ttl = negative_ttl
+        self.negative_max_entries = negative_max_entries
+        self._entries: dict[str, dict[str, IndexedBlob]] = {}
+        self._missing: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        """Return the number of indexed blobs."""
+        return sum(len(entries) for entries in self._entries.values())
+
+    def get(self, container: str, blob: str) -> IndexedBlob | None:
+        """Return the indexed properties of a blob, or None if it is not indexed."""
+        return self._entries.get(container, {}).get(blob)
+
+    def missing(self, container: str, blob: str) -> bool:
+        """Return True if a blob is known not to exist."""
+        entries = self._entries.get(container)
+        if entries is not None:
+            return blob not in entries
+        expires = self._missing.get((container, blob))
+        if expires is None:
+            return False
+        if time.monotonic() < expires:
+            return True
+        del self._missing[(container, blob)]
+        return False
+
+    def forget(self, container: str, blob: str) -> None:
+        """Record that a blob was not found in Blob Storage."""
+        entries = self._entries.get(container)
+        if entries is not None:
+            entries.pop(blob, None)
+            return
+        if not self.negative_ttl:
+            return
+        self._missing[(container, blob)] = time.monotonic() + self.negative_ttl
+        self._missing.move_to_end((container, blob))
+        while len(self._missing) > self.negative_max_entries:
+            self._missing.popitem(last=False)
+
+    async def refresh(self, container: str) -> None:
+        """List a container page by page and update its index."""
+        started = time.perf_counter()
+        live = self._entries.get(container)
+        listed = {}
+        container_client = self.blob_clients.get().get_container_client(container)
+        async for page in container_client.list_blobs().by_page():
+            async for properties in page:
+                entry = IndexedBlob(
+                    etag=properties.etag,
+                    last_modified=properties.last_modified,
+                    size=properties.size,
+                    content_type=properties.content_settings.content_type,
+                )
+                listed[properties.name] = entry
+                if live is not None:
+                    live[properties.name] = entry
+        self._entries[container] = listed
+        logger.debug("Blob index refreshed", container=container, blobs=len(listed), seconds=round(time.perf_counter() - started, 1))
+
+    async def _refresh(self, container: str) -> None:
+        try:
+            await self.refresh(container)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Blob index refresh failed", container=container, error=str(e))
+
+    async def _run(self) -> None:
+        while True:
+            for container in self.containers:
+                await self._refresh(container)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start indexing in the background."""
+        if self.containers:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop indexing."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
@@ -0,0 +1,115 @@
+"""Cache Warm-Up for the Image Hosting Service."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from kiroshi.settings import settings
+
+if TYPE_CHECKING:
+    from kiroshi.server.image.server import ImageServer
+
+
+class Prefetcher:
+    """Fills the image caches ahead of traffic, so a freshly started server does not send every request to Blob Storage.
+
+    Targets are "container:prefix" strings, every blob under the prefix is listed and downloaded until the caches
+    would be full. A keys file lists one "container:blob" per line, hottest first, and is fetched before any listing.
+    """
+
+    def __init__(
+        self,
+        images: "ImageServer",
+        targets: list[str] = settings.image_server_prefetch,
+        keys: Path | None = settings.image_server_prefetch_keys,
+        concurrency: int = settings.image_server_prefetch_concurrency,
+        timeout: float = settings.image_server_prefetch_timeout,
+    ) -> None:
+        """Initialize the Prefetcher class.
+
+        Args:
+            images (ImageServer): Image server whose caches to fill.
+            targets (list[str]): Containers and prefixes to list, as "container:prefix".
+            keys (Path): File of "container:blob" lines to fetch first.
+            concurrency (int): Number of blobs downloaded at once.
+            timeout (float): Seconds after which prefetching gives up so the server can report ready.
+
+        """
+        self.images = images
+        self.targets = targets
+        self.keys = keys
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.fetched = 0
+        self.failed = 0
+
+    @property
+    def capacity(self) -> int:
+        """Return the total size of all cache tiers in bytes."""
+        return sum(tier.max_bytes for tier in self.images.tiers)
+
+    @property
+    def max_entry_bytes(self) -> int:
+        """Return the size of the largest blob any cache tier will hold."""
+        return max(tier.max_entry_bytes for tier in self.images.tiers)
+
+    async def _enqueue(self, queue: asyncio.Queue[tuple[str, str] | None]) -> None:
+        """Queue the blobs to prefetch, stopping once they would fill the caches."""
+        if self.keys is not None:
+            lines = await asyncio.to_thread(self.keys.read_text)
+            for line in lines.splitlines():
+                container, _, blob = line.strip().partition(":")
+                if container and blob:
+                    await queue.put((container, blob))
+        queued = 0
+        for target in self.targets:
+            container, _, prefix = target.partition(":")
+            try:
+                container_client = self.images.blob_clients.get().get_container_client(container)
+                async for properties in container_client.list_blobs(name_starts_with=prefix or None):
+                    if properties.size > self.max_entry_bytes:
+                        continue
+                    queued += properties.size
+                    if queued > self.capacity:
+                        logger.info("Prefetch stopped listing as the cache is full", container=container, prefix=prefix)
+                        return
+                    await queue.put((container, properties.name))
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Prefetch could not list blobs", container=container, prefix=prefix, error=str(e))
+
+    async def _work(self, queue: asyncio.Queue[tuple[str, str] | None]) -> None:
+        while (item := await queue.get()) is not None:
+            container, blob = item
+            try:
+                await self.images.prefetch(container, blob)
+            except Exception as e:  # noqa: BLE001
+                self.failed += 1
+                logger.debug("Prefetch failed", container=container, blob=blob, error=str(e))
+            else:
+                self.fetched += 1
+
+    async def _prefetch(self) -> None:
+        queue: asyncio.Queue[tuple[str, str] | None] = asyncio.Queue(maxsize=self.concurrency * 2)
+        async with asyncio.TaskGroup() as group:
+            for _ in range(self.concurrency):
+                group.create_task(self._work(queue))
+            await self._enqueue(queue)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+    async def run(self) -> None:
+        """Prefetch all targets, giving up after the timeout."""
+        if not self.targets and self.keys is None:
+            return
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self._prefetch()
+        except TimeoutError:
+            logger.warning("Prefetch did not finish in time", timeout=self.timeout)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Prefetch failed", error=str(e))
+        logger.info("Prefetch finished", fetched=self.fetched, failed=self.failed, seconds=round(time.perf_counter() - started, 1))
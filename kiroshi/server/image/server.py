@@ -1,53 +1,574 @@
 """Runs the Server Component for the Image Hosting Service."""
 
-import io
+import asyncio
 import logging
 import mimetypes
+import multiprocessing
 import pathlib
-from typing import Annotated
+import secrets
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime
+from typing import Annotated, Literal
 
-from azure.core.exceptions import ResourceNotFoundError
-from azure.storage.blob.aio import BlobServiceClient
-from fastapi import APIRouter, FastAPI, Header, Path, status
-from fastapi.responses import Response
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.storage.blob import BlobProperties
+from azure.storage.blob.aio import BlobClient, StorageStreamDownloader
+from fastapi import APIRouter, FastAPI, Header, Path, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from PIL import Image, UnidentifiedImageError
 
 from kiroshi.server.common.healthchecks import Healthchecks
+from kiroshi.server.common.metrics import Metrics, MetricsMiddleware
+from kiroshi.server.common.storage import BlobClientPool
+from kiroshi.server.image.cache import CachedBlob, DiskBlob, DiskCache, DiskWrite, Key, MemoryCache
+from kiroshi.server.image.coalesce import SingleFlight
+from kiroshi.server.image.compression import ENCODINGS, compress, compressible, encoded_etag, negotiate_encoding
+from kiroshi.server.image.http import http_date, if_range_matches, not_modified, parse_range
+from kiroshi.server.image.index import BlobIndex, IndexedBlob
+from kiroshi.server.image.prefetch import Prefetcher
+from kiroshi.server.image.transform import SOURCE_FORMATS, Variant, negotiate, render
 from kiroshi.settings import InterceptHandler, settings
 
 
 class ImageServer:
     """Image Server Class."""
 
-    def __init__(self) -> None:
-        """Initialize the ImageServer class."""
+    def __init__(
+        self,
+        blob_clients: BlobClientPool,
+        cache: MemoryCache,
+        metrics: Metrics,
+        disk_cache: DiskCache | None = None,
+        transforms: Executor | None = None,
+        index: BlobIndex | None = None,
+        *,
+        streaming: bool = settings.image_server_streaming,
+        cache_control: str = settings.image_server_cache_control,
+        auto_format: bool = settings.image_server_auto_format,
+        transform_max_bytes: int = settings.image_server_transform_max_bytes,
+        compression_max_bytes: int = settings.image_server_compression_max_bytes,
+    ) -> None:
+        """Initialize the ImageServer class.
+
+        Args:
+            blob_clients (BlobClientPool): Shared Blob Storage clients.
+            cache (MemoryCache): Cache for frequently requested blobs.
+            metrics (Metrics): Prometheus metrics to record cache results to.
+            disk_cache (DiskCache): Optional second cache tier on local disk.
+            transforms (Executor): Worker pool for resizing and re-encoding images.
+            index (BlobIndex): Optional listing of blobs used to answer 404s and HEAD requests without Blob Storage.
+            streaming (bool): Stream blobs to clients as they are downloaded rather than buffering them.
+            cache_control (str): Cache-Control header sent with every image.
+            auto_format (bool): Serve WebP or AVIF to clients that accept them even without transform parameters.
+            transform_max_bytes (int): Images larger than this are always served as-is.
+            compression_max_bytes (int): Blobs larger than this are not compressed on the fly.
+
+        """
+        self.blob_clients = blob_clients
+        self.cache = cache
+        self.metrics = metrics
+        self.disk_cache = disk_cache
+        self.tiers = [cache] if disk_cache is None else [cache, disk_cache]
+        self.flights = SingleFlight()
+        self.transforms = transforms
+        self.index = index
+        self.streaming = streaming
+        self.cache_control = cache_control
+        self.auto_format = auto_format
+        self.transform_max_bytes = transform_max_bytes
+        self.compression_max_bytes = compression_max_bytes
         self.router = APIRouter()
-        self.router.add_api_route("/content/{blob:path}", self.serve, response_class=Response)
+        self.router.add_api_route("/content/{blob:path}", self.serve, response_class=Response, methods=["GET", "HEAD"])
+
+    def _headers(self, etag: str, last_modified: datetime) -> dict[str, str]:
+        return {"ETag": etag, "Last-Modified": http_date(last_modified), "Cache-Control": self.cache_control, "Accept-Ranges": "bytes"}
+
+    async def _cached(self, container: str, blob: Key) -> CachedBlob | DiskBlob | None:
+        """Return the best cached copy of a blob, preferring fresh entries and memory over disk.
+
+        A disk entry whose file has been removed from under the cache is dropped, so the blob is treated as a miss.
+        """
+        entries = [entry for tier in self.tiers if (entry := tier.get(container, blob)) is not None]
+        cached = next((entry for entry in entries if entry.fresh), next(iter(entries), None))
+        if isinstance(cached, DiskBlob) and not await asyncio.to_thread(cached.path.is_file):
+            self.disk_cache.discard(container, blob)
+            return self.cache.get(container, blob)
+        return cached
+
+    def _revalidated(self, container: str, blob: Key, etag: str) -> None:
+        """Restart the TTL of every cached copy of a blob that matches its current ETag."""
+        for tier in self.tiers:
+            entry = tier.get(container, blob)
+            if entry is not None and entry.etag == etag:
+                tier.refresh(entry)
+
+    def _record(self, cached: CachedBlob | DiskBlob | None) -> None:
+        """Record the result of a cache lookup."""
+        if cached is None:
+            result = "miss"
+        elif not cached.fresh:
+            result = "stale"
+        else:
+            result = "memory" if isinstance(cached, CachedBlob) else "disk"
+        self.metrics.cache_requests.labels(result=result).inc()
+
+    def _discard(self, container: str, blob: str) -> None:
+        for tier in self.tiers:
+            tier.discard(container, blob)
+        if self.index is not None:
+            self.index.forget(container, blob)
+
+    async def _cached_response(self, container: str, blob: Key, cached: CachedBlob | DiskBlob, mimetype: str, encoding: str | None = None) -> Response:
+        """Return a response for a cached blob, promoting small blobs from disk to memory."""
+        headers = self._headers(cached.etag, cached.last_modified)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if isinstance(cached, DiskBlob):
+            if not self.cache.cacheable(cached.size):
+                return FileResponse(cached.path, media_type=mimetype, headers=headers)
+            content = await asyncio.to_thread(cached.path.read_bytes)
+            entry = self.cache.put(container, blob, etag=cached.etag, last_modified=cached.last_modified, content=content)
+            entry.expires = cached.expires
+            return Response(content=content, media_type=mimetype, headers=headers)
+        return Response(content=cached.content, media_type=mimetype, headers=headers)
+
+    def _head_response(self, cached: CachedBlob | DiskBlob, mimetype: str, encoding: str | None = None) -> Response:
+        """Return the headers a GET for a cached blob would be answered with."""
+        headers = {**self._headers(cached.etag, cached.last_modified), "Content-Length": str(cached.size)}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(media_type=mimetype, headers=headers)
+
+    async def _validators(
+        self,
+        blob_client: BlobClient,
+        container: str,
+        blob: str,
+        *,
+        required: bool,
+        indexed: bool = False,
+    ) -> CachedBlob | DiskBlob | IndexedBlob | BlobProperties | None:
+        """Return the current ETag, Last-Modified and size of a blob, only asking Blob Storage if they are required.
+
+        With indexed set, the blob index may answer instead of Blob Storage. Its properties can be up to one refresh
+        interval old, so it is only used where a stale ETag cannot fail a later conditional download.
+        """
+        cached = await self._cached(container, blob)
+        if cached is not None and cached.fresh:
+            return cached
+        if not required:
+            return None
+        if indexed and self.index is not None and (entry := self.index.get(container, blob)) is not None:
+            return entry
+        with self.metrics.upstream():
+            properties = await blob_client.get_blob_properties()
+        self._revalidated(container, blob, properties.etag)
+        cached = await self._cached(container, blob)
+        return cached if cached is not None and cached.fresh else properties
+
+    async def _download(self, blob_client: BlobClient, container: str, blob: str, cached: CachedBlob | DiskBlob | None) -> CachedBlob | DiskBlob | DiskWrite | StorageStreamDownloader:
+        """Download a blob, adding it to the cache if it is small enough.
+
+        Shared between concurrent requests for the same blob. Returns the cached entry if the blob was cached
+        or revalidated. Blobs too large for memory are written to the disk tier in the background, and every
+        waiting request follows the file as it is written. Returns the downloader only for blobs too large
+        for any tier, for the caller that started the download to stream.
+        """
+        conditions = {"etag": cached.etag, "match_condition": MatchConditions.IfModified} if cached is not None else {}
+        try:
+            with self.metrics.upstream():
+                download = await blob_client.download_blob(**conditions)
+        except HttpResponseError as e:
+            if e.status_code != status.HTTP_304_NOT_MODIFIED:
+                raise
+            self._revalidated(container, blob, cached.etag)
+            return cached
+        properties = download.properties
+        if not self.cache.cacheable(properties.size):
+            if self.disk_cache is None or not self.disk_cache.cacheable(properties.size):
+                return download
+            return await self.disk_cache.write(
+                container,
+                blob,
+                etag=properties.etag,
+                last_modified=properties.last_modified,
+                # The SDK decodes blobs stored with a Content-Encoding, so their stored size is not the length written
+                size=None if properties.content_settings.content_encoding else properties.size,
+                chunks=self.metrics.upstream_chunks(download.chunks()),
+            )
+        with self.metrics.upstream():
+            content = await download.readall()
+        entry = self.cache.put(container, blob, etag=properties.etag, last_modified=properties.last_modified, content=content)
+        if self.disk_cache is not None:
+            disk_entry = await self.disk_cache.put(container, blob, etag=properties.etag, last_modified=properties.last_modified, content=content)
+            entry = entry or disk_entry
+        # A blob stored with a Content-Encoding can decode to more than the cache will hold
+        return entry or CachedBlob(etag=properties.etag, last_modified=properties.last_modified, content=content)
+
+    async def _fetch(self, blob_client: BlobClient, container: str, blob: str, mimetype: str) -> Response:
+        """Return a response containing the blob, from the cache where possible."""
+        cached = await self._cached(container, blob)
+        self._record(cached)
+        if cached is not None and cached.fresh:
+            return await self._cached_response(container, blob, cached, mimetype)
+        writing = self.disk_cache.writing(container, blob) if self.disk_cache is not None else None
+        if writing is not None:
+            result, leader = writing, False
+        else:
+            result, leader = await self.flights.do((container, blob), lambda: self._download(blob_client, container, blob, cached))
+        if isinstance(result, DiskWrite) and result.entry is not None:
+            result = result.entry
+        if isinstance(result, CachedBlob | DiskBlob):
+            return await self._cached_response(container, blob, result, mimetype)
+        if isinstance(result, DiskWrite) and result.error is None:
+            headers = self._headers(result.etag, result.last_modified)
+            if result.size is not None:
+                headers["Content-Length"] = str(result.size)
+            return StreamingResponse(content=result.read(), media_type=mimetype, headers=headers)
+        # Too large for any cache tier to share, only one request can consume the leader's stream.
+        # If the shared write to disk has already failed, every request downloads the blob itself.
+        if leader and not isinstance(result, DiskWrite):
+            download = result
+        else:
+            with self.metrics.upstream():
+                download = await blob_client.download_blob()
+        properties = download.properties
+        headers = self._headers(properties.etag, properties.last_modified)
+        chunks = self.metrics.upstream_chunks(download.chunks())
+        if self.streaming:
+            # The SDK decodes blobs stored with a Content-Encoding, so their stored size is not the length sent
+            if not properties.content_settings.content_encoding:
+                headers["Content-Length"] = str(properties.size)
+            return StreamingResponse(content=chunks, media_type=mimetype, headers=headers)
+        return Response(content=b"".join([chunk async for chunk in chunks]), media_type=mimetype, headers=headers)
+
+    async def _range(self, blob_client: BlobClient, validators: CachedBlob | DiskBlob | BlobProperties, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield a byte range of a blob, downloading only the requested bytes."""
+        if isinstance(validators, CachedBlob):
+            yield validators.content[start : end + 1]
+            return
+        if isinstance(validators, DiskBlob):
+            async for chunk in self.disk_cache.read(validators, start, end):
+                yield chunk
+            return
+        with self.metrics.upstream():
+            download = await blob_client.download_blob(
+                offset=start,
+                length=end - start + 1,
+                etag=validators.etag,
+                match_condition=MatchConditions.IfNotModified,
+            )
+        async for chunk in self.metrics.upstream_chunks(download.chunks()):
+            yield chunk
+
+    async def _multipart(self, blob_client: BlobClient, validators: CachedBlob | DiskBlob | BlobProperties, parts: list[tuple[int, int, bytes]], closing: bytes) -> AsyncIterator[bytes]:
+        """Yield a multipart/byteranges body."""
+        for start, end, part_headers in parts:
+            yield part_headers
+            async for chunk in self._range(blob_client, validators, start, end):
+                yield chunk
+        yield closing
+
+    def _ranges(self, blob_client: BlobClient, validators: CachedBlob | DiskBlob | BlobProperties, ranges: list[tuple[int, int]], mimetype: str) -> Response:
+        """Return a 206 response for the requested ranges, or 416 if none are satisfiable."""
+        headers = self._headers(validators.etag, validators.last_modified)
+        if not ranges:
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={**headers, "Content-Range": f"bytes */{validators.size}"})
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            return StreamingResponse(
+                content=self._range(blob_client, validators, start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=mimetype,
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{validators.size}", "Content-Length": str(end - start + 1)},
+            )
+        boundary = secrets.token_hex(16)
+        parts = []
+        for start, end in ranges:
+            delimiter = f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{end}/{validators.size}\r\n\r\n".encode()
+            parts.append((start, end, b"\r\n" + delimiter if parts else delimiter))
+        closing = f"\r\n--{boundary}--\r\n".encode()
+        length = sum(len(part_headers) + end - start + 1 for start, end, part_headers in parts) + len(closing)
+        return StreamingResponse(
+            content=self._multipart(blob_client, validators, parts, closing),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=f"multipart/byteranges; boundary={boundary}",
+            headers={**headers, "Content-Length": str(length)},
+        )
+
+    def _variant(self, mimetype: str, accept: str | None, width: int | None, height: int | None, quality: int | None, format_: str | None) -> Variant | None:
+        """Return the variant of an image to serve, or None to serve the original."""
+        source_format = SOURCE_FORMATS.get(mimetype)
+        transform = width is not None or height is not None or quality is not None
+        if source_format is None or not (transform or format_ or self.auto_format):
+            return None
+        variant = Variant(format=format_ or negotiate(accept, source_format), width=width, height=height, quality=quality)
+        if not transform and variant.media_type == mimetype:
+            return None
+        return variant
+
+    async def _render(self, blob_client: BlobClient, container: str, blob: str, key: Key, source: CachedBlob | DiskBlob | BlobProperties, variant: Variant) -> CachedBlob | DiskBlob:
+        """Render a variant of an image in the worker pool and cache the result."""
+        if isinstance(source, CachedBlob):
+            content = source.content
+        elif isinstance(source, DiskBlob):
+            content = await asyncio.to_thread(source.path.read_bytes)
+        else:
+            with self.metrics.upstream():
+                download = await blob_client.download_blob(etag=source.etag, match_condition=MatchConditions.IfNotModified)
+                content = await download.readall()
+            self.cache.put(container, blob, etag=source.etag, last_modified=source.last_modified, content=content)
+        rendered = await asyncio.get_running_loop().run_in_executor(self.transforms, render, content, variant)
+        etag = variant.etag(source.etag)
+        entry = self.cache.put(container, key, etag=etag, last_modified=source.last_modified, content=rendered)
+        if self.disk_cache is not None:
+            disk_entry = await self.disk_cache.put(container, key, etag=etag, last_modified=source.last_modified, content=rendered)
+            entry = entry or disk_entry
+        return entry or CachedBlob(etag=etag, last_modified=source.last_modified, content=rendered)
+
+    async def _derivative(
+        self,
+        blob_client: BlobClient,
+        container: str,
+        blob: str,
+        mimetype: str,
+        variant: Variant,
+        if_none_match: str | None,
+        if_modified_since: str | None,
+        *,
+        head: bool = False,
+    ) -> Response | None:
+        """Return a response containing a variant of an image, rendering each variant only once.
+
+        HEAD requests are only answered from a variant that is already cached, otherwise None is returned so they
+        are answered with the original's headers rather than downloading and rendering the image.
+        """
+        key = (blob, "variant", variant.key)
+        cached = await self._cached(container, key)
+        if head and (cached is None or not cached.fresh):
+            return None
+        self._record(cached)
+        if cached is None or not cached.fresh:
+            source = await self._validators(blob_client, container, blob, required=True)
+            etag = variant.etag(source.etag)
+            if cached is not None and cached.etag == etag:
+                self._revalidated(container, key, etag)
+            elif source.size > self.transform_max_bytes:
+                return await self._fetch(blob_client, container, blob, mimetype)
+            else:
+                try:
+                    cached, _ = await self.flights.do((container, key), lambda: self._render(blob_client, container, blob, key, source, variant))
+                except (UnidentifiedImageError, Image.DecompressionBombError):
+                    return Response(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        if not_modified(cached.etag, cached.last_modified, if_none_match, if_modified_since):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self._headers(cached.etag, cached.last_modified))
+        if head:
+            return self._head_response(cached, variant.media_type)
+        return await self._cached_response(container, key, cached, variant.media_type)
+
+    async def _sibling(self, container: str, blob: str) -> bytes | None:
+        """Return the content of a precompressed sibling blob, or None if there is none."""
+        if self.index is not None and self.index.missing(container, blob):
+            return None
+        try:
+            with self.metrics.upstream():
+                download = await self.blob_clients.get().get_blob_client(container=container, blob=blob).download_blob()
+                return await download.readall()
+        except ResourceNotFoundError:
+            return None
+
+    async def _encode(self, blob_client: BlobClient, container: str, blob: str, key: Key, source: CachedBlob | DiskBlob | BlobProperties, encoding: str) -> CachedBlob | DiskBlob:
+        """Compress a blob and cache the result, preferring a precompressed sibling blob if one exists."""
+        compressed = await self._sibling(container, blob + ENCODINGS[encoding])
+        if compressed is None:
+            if isinstance(source, CachedBlob):
+                content = source.content
+            elif isinstance(source, DiskBlob):
+                content = await asyncio.to_thread(source.path.read_bytes)
+            else:
+                with self.metrics.upstream():
+                    download = await blob_client.download_blob(etag=source.etag, match_condition=MatchConditions.IfNotModified)
+                    content = await download.readall()
+            compressed = await asyncio.to_thread(compress, content, encoding)
+        etag = encoded_etag(source.etag, encoding)
+        entry = self.cache.put(container, key, etag=etag, last_modified=source.last_modified, content=compressed)
+        if self.disk_cache is not None:
+            disk_entry = await self.disk_cache.put(container, key, etag=etag, last_modified=source.last_modified, content=compressed)
+            entry = entry or disk_entry
+        return entry or CachedBlob(etag=etag, last_modified=source.last_modified, content=compressed)
+
+    async def _encoded(
+        self,
+        blob_client: BlobClient,
+        container: str,
+        blob: str,
+        mimetype: str,
+        encoding: str,
+        if_none_match: str | None,
+        if_modified_since: str | None,
+        *,
+        head: bool = False,
+    ) -> Response | None:
+        """Return a response containing a compressed blob, or None if it should be sent uncompressed.
+
+        HEAD requests are only answered from a compressed copy that is already cached, as for variants.
+        """
+        key = (blob, "encoding", encoding)
+        cached = await self._cached(container, key)
+        if head and (cached is None or not cached.fresh):
+            return None
+        self._record(cached)
+        if cached is None or not cached.fresh:
+            source = await self._validators(blob_client, container, blob, required=True)
+            etag = encoded_etag(source.etag, encoding)
+            if cached is not None and cached.etag == etag:
+                self._revalidated(container, key, etag)
+            elif source.size > self.compression_max_bytes:
+                return None
+            else:
+                cached, _ = await self.flights.do((container, key), lambda: self._encode(blob_client, container, blob, key, source, encoding))
+        if not_modified(cached.etag, cached.last_modified, if_none_match, if_modified_since):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self._headers(cached.etag, cached.last_modified))
+        if head:
+            return self._head_response(cached, mimetype, encoding=encoding)
+        return await self._cached_response(container, key, cached, mimetype, encoding=encoding)
+
+    async def _original(
+        self,
+        blob_client: BlobClient,
+        container: str,
+        blob: str,
+        mimetype: str,
+        *,
+        head: bool,
+        if_none_match: str | None,
+        if_modified_since: str | None,
+        range_: str | None,
+        if_range: str | None,
+    ) -> Response:
+        """Return a response for the original blob."""
+        validators = await self._validators(
+            blob_client,
+            container,
+            blob,
+            required=head or any(header is not None for header in (if_none_match, if_modified_since, range_)),
+            indexed=head,
+        )
+        if validators is not None and not_modified(validators.etag, validators.last_modified, if_none_match, if_modified_since):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self._headers(validators.etag, validators.last_modified))
+        if head:
+            return Response(media_type=mimetype, headers={**self._headers(validators.etag, validators.last_modified), "Content-Length": str(validators.size)})
+        if range_ is not None and if_range_matches(validators.etag, validators.last_modified, if_range):
+            ranges = parse_range(range_, validators.size)
+            if ranges is not None:
+                return self._ranges(blob_client, validators, ranges, mimetype)
+        return await self._fetch(blob_client, container, blob, mimetype)
+
+    async def prefetch(self, container: str, blob: str) -> None:
+        """Download a blob into the cache ahead of the first request for it."""
+        cached = await self._cached(container, blob)
+        if cached is not None and cached.fresh:
+            return
+        result = self.disk_cache.writing(container, blob) if self.disk_cache is not None else None
+        if result is None:
+            blob_client = self.blob_clients.get().get_blob_client(container=container, blob=blob)
+            result, _ = await self.flights.do((container, blob), lambda: self._download(blob_client, container, blob, cached))
+        if isinstance(result, DiskWrite):
+            await result.wait()
 
     async def serve(
         self,
+        request: Request,
         container: Annotated[str | None, Header(min_length=1)],
         blob: Annotated[str | None, Path(min_length=1, max_length=100)],
+        if_none_match: Annotated[str | None, Header()] = None,
+        if_modified_since: Annotated[str | None, Header()] = None,
+        range_: Annotated[str | None, Header(alias="range")] = None,
+        if_range: Annotated[str | None, Header()] = None,
+        accept: Annotated[str | None, Header()] = None,
+        accept_encoding: Annotated[str | None, Header()] = None,
+        width: Annotated[int | None, Query(ge=1, le=settings.image_server_transform_max_dimension)] = None,
+        height: Annotated[int | None, Query(ge=1, le=settings.image_server_transform_max_dimension)] = None,
+        quality: Annotated[int | None, Query(ge=1, le=100)] = None,
+        format_: Annotated[Literal["avif", "webp", "jpeg", "png"] | None, Query(alias="format")] = None,
     ) -> Response:
         """Serve Images."""
-        client = BlobServiceClient.from_connection_string(settings.blob_storage_account_dsn)
-        mimetype = mimetypes.types_map.get(pathlib.Path(blob).suffix, "application/octet-stream")
-        async with client:
-            fo = io.BytesIO()
-            try:
-                blob_client = client.get_blob_client(container=container, blob=blob)
-                download = await blob_client.download_blob()
-            except ResourceNotFoundError:
-                return Response(status_code=status.HTTP_404_NOT_FOUND)
-            await download.readinto(fo)
-            fo.seek(0)
-            return Response(content=fo.read(), media_type=mimetype)
+        if self.index is not None and self.index.missing(container, blob):
+            self.metrics.cache_requests.labels(result="absent").inc()
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        indexed = self.index.get(container, blob) if self.index is not None else None
+        client = self.blob_clients.get()
+        blob_client = client.get_blob_client(container=container, blob=blob)
+        mimetype = mimetypes.types_map.get(pathlib.Path(blob).suffix) or (indexed and indexed.content_type) or "application/octet-stream"
+        variant = self._variant(mimetype, accept, width, height, quality, format_)
+        encoding = negotiate_encoding(accept_encoding) if compressible(mimetype) and range_ is None else None
+        head = request.method == "HEAD"
+        try:
+            response = None
+            if variant is not None:
+                response = await self._derivative(blob_client, container, blob, mimetype, variant, if_none_match, if_modified_since, head=head)
+            elif encoding is not None:
+                response = await self._encoded(blob_client, container, blob, mimetype, encoding, if_none_match, if_modified_since, head=head)
+            if response is None:
+                response = await self._original(
+                    blob_client,
+                    container,
+                    blob,
+                    mimetype,
+                    head=head,
+                    if_none_match=if_none_match,
+                    if_modified_since=if_modified_since,
+                    range_=range_,
+                    if_range=if_range,
+                )
+        except ResourceNotFoundError:
+            self._discard(container, blob)
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        if format_ is None and mimetype in SOURCE_FORMATS and (self.auto_format or variant is not None):
+            response.headers["Vary"] = "Accept"
+        elif compressible(mimetype):
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+metrics = Metrics()
+blob_clients = BlobClientPool()
+transforms = ProcessPoolExecutor(max_workers=settings.image_server_transform_workers, mp_context=multiprocessing.get_context("spawn"))
+cache = MemoryCache()
+disk_cache = DiskCache(path=settings.image_server_disk_cache_path) if settings.image_server_disk_cache_path else None
+index = BlobIndex(blob_clients=blob_clients) if settings.image_server_index_containers or settings.image_server_negative_ttl else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:  # noqa: ARG001
+    """Start background readiness checks, indexing and cache prefetching, close shared clients and worker pools on shutdown."""
+    healthchecks.start()
+    if index is not None:
+        index.start()
+    warmup = asyncio.create_task(prefetcher.run())
+    healthchecks.wait_for(warmup, "cache prefetch has not finished yet")
+    yield
+    warmup.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup
+    await healthchecks.stop()
+    if index is not None:
+        await index.stop()
+    await blob_clients.close()
+    transforms.shutdown(wait=False, cancel_futures=True)
 
 
-app = FastAPI()
-images = ImageServer()
-healthchecks = Healthchecks()
+app = FastAPI(lifespan=lifespan)
+images = ImageServer(blob_clients=blob_clients, cache=cache, metrics=metrics, disk_cache=disk_cache, transforms=transforms, index=index)
+healthchecks = Healthchecks(blob_clients=blob_clients)
+prefetcher = Prefetcher(images=images)
 app.include_router(images.router)
 app.include_router(healthchecks.router)
+app.include_router(metrics.router)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 for log_name in ("uvicorn", "fastapi"):
     logging.getLogger(log_name).handlers = [InterceptHandler()]
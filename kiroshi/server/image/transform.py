@@ -0,0 +1,103 @@
+"""Image Transformations for the Image Hosting Service.
+
+Rendering runs in worker processes, so this module must stay importable without the rest of Kiroshi.
+"""
+
+import hashlib
+import io
+from dataclasses import dataclass
+
+from PIL import Image, features
+
+FORMATS = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+SOURCE_FORMATS = {
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/gif": "png",
+    "image/webp": "webp",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Variant:
+    """A derivative of a source image."""
+
+    format: str
+    width: int | None = None
+    height: int | None = None
+    quality: int | None = None
+
+    @property
+    def key(self) -> str:
+        """Return a string uniquely identifying this variant."""
+        return f"w={self.width or ''}&h={self.height or ''}&q={self.quality or ''}&f={self.format}"
+
+    @property
+    def media_type(self) -> str:
+        """Return the Content-Type of this variant."""
+        return FORMATS[self.format]
+
+    def etag(self, source_etag: str) -> str:
+        """Return the ETag of this variant rendered from a source at the given ETag."""
+        digest = hashlib.sha256(self.key.encode()).hexdigest()[:16]
+        source = source_etag.strip('"')
+        return f'"{source}-{digest}"'
+
+
+def supported_formats() -> list[str]:
+    """Return the output formats available in this Pillow build, most preferred first."""
+    return [name for name in FORMATS if name not in ("avif", "webp") or features.check(name)]
+
+
+def negotiate(accept: str | None, default: str) -> str:
+    """Pick the best output format the client accepts, falling back to the source format.
+
+    Args:
+        accept (str): Accept request header.
+        default (str): Format to use if the client accepts no better format.
+
+    Returns:
+        str: Output format name.
+
+    """
+    accepted = set()
+    for item in (accept or "").split(","):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        weights = [value for name, _, value in (param.partition("=") for param in params) if name.strip().lower() == "q"]
+        try:
+            weight = float(weights[0]) if weights else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(media_type.lower())
+    for name in supported_formats():
+        if name in ("avif", "webp") and FORMATS[name] in accepted:
+            return name
+    return default
+
+
+def render(content: bytes, variant: Variant) -> bytes:
+    """Resize and re-encode an image.
+
+    Images are scaled down to fit within the requested width and height while keeping their aspect ratio,
+    they are never scaled up.
+    """
+    with Image.open(io.BytesIO(content)) as source:
+        image = source
+        if variant.width or variant.height:
+            size = (variant.width or image.width, variant.height or image.height)
+            image.draft("RGB", size)
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+        if variant.format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode == "P" and variant.format != "png":
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        options = {"quality": variant.quality} if variant.quality else {}
+        image.save(output, format=variant.format.upper(), **options)
+        return output.getvalue()
@@ -22,6 +22,50 @@ class Settings(BaseSettings):
     sftp_storage_account_dsn: str | None = None
     nfs_storage_account_dsn: str | None = None
 
+    sftp_window_size: int = 2 * 1024 * 1024
+    sftp_max_packet_size: int = 32 * 1024
+    sftp_keepalive: int = 30
+    sftp_compression: bool = False
+    sftp_ciphers: list[str] = []
+    sftp_prefetch_requests: int | None = None
+    sftp_connect_attempts: int = 5
+    sftp_connect_wait: float = 30.0
+
+    readiness_interval: float = 10.0
+    readiness_timeout: float = 5.0
+
+    image_server_workers: int = 1
+    image_server_loop: str = "auto"
+    image_server_http: str = "auto"
+    image_server_timeout_keep_alive: int = 75
+    image_server_backlog: int = 2048
+    image_server_limit_concurrency: int | None = None
+    image_server_timeout_graceful_shutdown: int | None = 30
+    image_server_connection_limit: int = 100
+    image_server_connection_limit_per_host: int = 0
+    image_server_keepalive_timeout: float = 60.0
+    image_server_streaming: bool = True
+    image_server_cache_max_bytes: int = 256 * 1024 * 1024
+    image_server_cache_max_entry_bytes: int = 4 * 1024 * 1024
+    image_server_cache_ttl: float = 300.0
+    image_server_cache_control: str = "public, max-age=3600"
+    image_server_disk_cache_path: Path | None = None
+    image_server_disk_cache_max_bytes: int = 10 * 1024 * 1024 * 1024
+    image_server_disk_cache_max_entry_bytes: int = 1024 * 1024 * 1024
+    image_server_auto_format: bool = False
+    image_server_transform_workers: int = 2
+    image_server_transform_max_bytes: int = 32 * 1024 * 1024
+    image_server_transform_max_dimension: int = 4096
+    image_server_compression_max_bytes: int = 8 * 1024 * 1024
+    image_server_prefetch: list[str] = []
+    image_server_prefetch_keys: Path | None = None
+    image_server_prefetch_concurrency: int = 16
+    image_server_prefetch_timeout: float = 300.0
+    image_server_index_containers: list[str] = []
+    image_server_index_interval: float = 60.0
+    image_server_negative_ttl: float = 0.0
+    image_server_negative_max_entries: int = 100_000
+
     model_config = SettingsConfigDict(
         extra=Extra.ignore,
         env_file=".env",
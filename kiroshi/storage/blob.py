@@ -1,52 +1,445 @@
 """General Purpose Utility for moving Blobs between Storage Accounts."""
 
-import io
+import base64
+import json
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, suppress
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
 
-from azure.storage.blob import BlobServiceClient
+import requests
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobBlock, BlobClient, BlobPrefix, BlobProperties, BlobSasPermissions, BlobServiceClient, ContainerClient, generate_blob_sas
 from loguru import logger
 
 from kiroshi.settings import settings
 
+SOURCE_ETAG = "kiroshi_source_etag"
+BATCH_SIZE = 256
+
+
+class ByteBudget:
+    """Limits the number of bytes held in memory by concurrent transfers."""
+
+    def __init__(self, limit: int) -> None:
+        """Initialize the ByteBudget class.
+
+        Args:
+            limit (int): Maximum number of bytes reserved at once. A single reservation larger than this is
+                reduced to the limit, so it waits for all others to finish rather than forever.
+
+        """
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        """Block until the given number of bytes fit within the budget, then hold them until exit."""
+        size = min(size, self.limit)
+        with self._condition:
+            self._condition.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.used -= size
+                self._condition.notify_all()
+
+
+class Checkpoint:
+    """Records blobs that have been transferred, so an interrupted run can continue where it stopped.
+
+    Each transferred blob is appended to the file as a JSON line of its name and ETag. A blob is only skipped
+    while its ETag still matches, so blobs changed since the interrupted run are transferred again.
+    """
+
+    def __init__(self, path: Path | None) -> None:
+        """Initialize the Checkpoint class.
+
+        Args:
+            path (Path): File to record transferred blobs in, None to disable checkpointing.
+
+        """
+        self.path = path
+        self.completed: dict[str, str] = {}
+        self._partial = False
+        if path is not None and path.exists():
+            text = path.read_text()
+            for number, line in enumerate(text.splitlines(), start=1):
+                if line.strip():
+                    record = self._parse(line)
+                    if record is None:
+                        logger.warning("Skipping malformed checkpoint line", path=str(path), line=number)
+                        continue
+                    self.completed[record[0]] = record[1]
+            # a run killed mid-write leaves a partial line, later records must not be appended to it
+            self._partial = bool(text) and not text.endswith("\n")
+
+    @staticmethod
+    def _parse(line: str) -> tuple[str, str] | None:
+        """Return the name and ETag recorded on a line, None if the line is not a complete record."""
+        try:
+            record = json.loads(line)
+            return record["name"], record["etag"]
+        except (ValueError, TypeError, KeyError):
+            return None
+
+    def done(self, blob: BlobProperties) -> bool:
+        """Return True if a blob was transferred at its current ETag."""
+        return self.completed.get(blob.name) == blob.etag
+
+    def record(self, blob: BlobProperties) -> None:
+        """Record that a blob was transferred."""
+        self.completed[blob.name] = blob.etag
+        if self.path is not None:
+            with self.path.open("a") as f:
+                f.write(("\n" if self._partial else "") + json.dumps({"name": blob.name, "etag": blob.etag}) + "\n")
+            self._partial = False
+
 
 class Blob:
-    """Class for moving blobs between storage accounts."""
+    """Class for moving blobs between storage accounts.
+
+    In move mode every blob is copied and its source deleted. In sync mode sources are kept and only blobs
+    missing or different at the destination are copied. Every copy records the source ETag in the
+    destination's metadata so later syncs can recognise it.
+    """
 
-    def __init__(self, source: str, destination: str) -> None:
-        """Initialize the Blob class."""
+    def __init__(
+        self,
+        source: str,
+        destination: str,
+        *,
+        server_side: bool = True,
+        copy_timeout: float = 6 * 60 * 60,
+        poll_interval: float = 2.0,
+        concurrency: int = 8,
+        max_inflight_bytes: int = 256 * 1024 * 1024,
+        block_size: int = 8 * 1024 * 1024,
+        block_concurrency: int = 4,
+        mode: str = "move",
+        checkpoint: Path | None = None,
+        dry_run: bool = False,
+        list_concurrency: int = 4,
+    ) -> None:
+        """Initialize the Blob class.
+
+        Args:
+            source (str): Source Storage Location, format: <blob|sftp|nfs>:<container_name>:<directory_name>.
+            destination (str): Destination Storage Location, format: <blob|sftp|nfs>:<container_name>:<directory_name>.
+            server_side (bool): Have Blob Storage copy blobs itself, falling back to copying through this process.
+            copy_timeout (float): Seconds to wait for a server-side copy before aborting it.
+            poll_interval (float): Seconds between checks on a server-side copy.
+            concurrency (int): Number of blobs moved at once.
+            max_inflight_bytes (int): Maximum size of all blobs being copied through this process at once.
+            block_size (int): Blobs larger than this are copied through this process in blocks of this size.
+            block_concurrency (int): Number of blocks of a single blob copied at once.
+            mode (str): "move" to delete sources after copying them, "sync" to keep them and skip identical blobs.
+            checkpoint (Path): File recording transferred blobs, so a rerun skips them.
+            dry_run (bool): Only report what would be transferred.
+            list_concurrency (int): Number of sub-directories of the source directory listed at once.
+
+        """
         self.source_type, self.source_container, self.source_directory = source.split(":")
         self.destination_type, self.destination_container, self.destination_directory = destination.split(":")
+        self.server_side = server_side
+        self.copy_timeout = copy_timeout
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.budget = ByteBudget(max_inflight_bytes)
+        self.block_size = block_size
+        self.block_concurrency = block_concurrency
+        self.mode = mode
+        self.checkpoint = Checkpoint(checkpoint)
+        self.dry_run = dry_run
+        self.list_concurrency = list_concurrency
+        self._deletions: list[BlobProperties] = []
+        self.failed: list[str] = []
+        self.transferred = 0
+        self.skipped = 0
+        self.transferred_bytes = 0
+
+        self.source_client = self._client(self.source_type)
+        self.destination_client = self._client(self.destination_type)
+
+    def _client(self, storage_type: str) -> BlobServiceClient:
+        """Return a client for a storage type with enough pooled connections for every worker thread."""
+        dsn = {"blob": settings.blob_storage_account_dsn, "sftp": settings.sftp_storage_account_dsn, "nfs": settings.nfs_storage_account_dsn}.get(storage_type)
+        session = requests.Session()
+        connections = self.concurrency * self.block_concurrency
+        adapter = requests.adapters.HTTPAdapter(pool_connections=connections, pool_maxsize=connections)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return BlobServiceClient.from_connection_string(dsn, transport=RequestsTransport(session=session, session_owner=False))
+
+    def _source_url(self, source_blob: BlobClient) -> str | None:
+        """Return a URL the destination account can read the source blob from, or None if one cannot be made.
 
-        self.source_client = BlobServiceClient.from_connection_string(
-            settings.blob_storage_account_dsn if self.source_type == "blob" else settings.sftp_storage_account_dsn if self.source_type == "sftp" else settings.nfs_storage_account_dsn if self.source_type == "nfs" else None,
+        Signs a read-only SAS valid for the copy timeout when the source connection string has an account key.
+        """
+        account_key = getattr(self.source_client.credential, "account_key", None)
+        if account_key is None:
+            return source_blob.url if "sig=" in source_blob.url else None
+        now = datetime.now(tz=UTC)
+        sas = generate_blob_sas(
+            account_name=source_blob.account_name,
+            container_name=source_blob.container_name,
+            blob_name=source_blob.blob_name,
+            account_key=account_key,
+            permission=BlobSasPermissions(read=True),
+            start=now - timedelta(minutes=5),
+            expiry=now + timedelta(seconds=self.copy_timeout) + timedelta(minutes=5),
         )
+        return f"{source_blob.url}?{sas}"
 
-        self.destination_client = BlobServiceClient.from_connection_string(
-            settings.blob_storage_account_dsn if self.destination_type == "blob" else settings.sftp_storage_account_dsn if self.destination_type == "sftp" else settings.nfs_storage_account_dsn if self.destination_type == "nfs" else None,
+    def _metadata(self, blob: BlobProperties) -> dict[str, str]:
+        """Return the metadata to give a copy of a blob."""
+        return {**(blob.metadata or {}), SOURCE_ETAG: blob.etag.strip('"')}
+
+    def _identical(self, blob: BlobProperties, destination: BlobProperties | None) -> bool:
+        """Return True if the destination already holds the current version of a source blob."""
+        if destination is None or destination.size != blob.size:
+            return False
+        if (destination.metadata or {}).get(SOURCE_ETAG) == blob.etag.strip('"'):
+            return True
+        source_md5 = blob.content_settings.content_md5
+        return source_md5 is not None and source_md5 == destination.content_settings.content_md5
+
+    def _server_side_copy(self, source_blob: BlobClient, dest_blob: BlobClient, blob: BlobProperties) -> bool:
+        """Copy a blob within Blob Storage, returning False if the copy could not be completed."""
+        source_url = self._source_url(source_blob)
+        if source_url is None:
+            logger.warning("Cannot sign the source blob for a server-side copy", blob_name=source_blob.blob_name)
+            return False
+        try:
+            copy = dest_blob.start_copy_from_url(source_url, metadata=self._metadata(blob))
+            status = copy["copy_status"]
+            deadline = time.monotonic() + self.copy_timeout
+            while status == "pending":
+                if time.monotonic() > deadline:
+                    dest_blob.abort_copy(copy["copy_id"])
+                    logger.warning("Server-side copy timed out", blob_name=source_blob.blob_name, timeout=self.copy_timeout)
+                    return False
+                time.sleep(self.poll_interval)
+                properties = dest_blob.get_blob_properties()
+                status = properties.copy.status
+        except HttpResponseError as e:
+            logger.warning("Server-side copy failed", blob_name=source_blob.blob_name, error=e.reason or str(e))
+            return False
+        if status != "success":
+            logger.warning("Server-side copy did not succeed", blob_name=source_blob.blob_name, status=status)
+            return False
+        return True
+
+    def _copy_block(self, source_blob: BlobClient, dest_blob: BlobClient, blob: BlobProperties, index: int) -> BlobBlock:
+        """Copy one block of a blob, failing if the source changes part way through."""
+        offset = index * self.block_size
+        download = source_blob.download_blob(
+            offset=offset,
+            length=min(self.block_size, blob.size - offset),
+            etag=blob.etag,
+            match_condition=MatchConditions.IfNotModified,
         )
+        block_id = base64.b64encode(f"{index:032d}".encode()).decode()
+        dest_blob.stage_block(block_id=block_id, data=download.readall())
+        return BlobBlock(block_id=block_id)
+
+    def _stream_copy(self, source_blob: BlobClient, dest_blob: BlobClient, blob: BlobProperties) -> None:
+        """Copy a blob by downloading it and uploading it again.
+
+        Blobs larger than the block size are copied in blocks, several at a time, and committed once all have
+        been staged, so memory use is bounded by the block size rather than the size of the blob.
+        """
+        if blob.size <= self.block_size:
+            with self.budget.reserve(blob.size):
+                logger.info("Downloading Blob", blob_name=source_blob.blob_name, container_name=self.source_container)
+                content = source_blob.download_blob(etag=blob.etag, match_condition=MatchConditions.IfNotModified).readall()
+                logger.info("Uploading Blob", blob_name=dest_blob.blob_name, container_name=self.destination_container)
+                dest_blob.upload_blob(content, overwrite=True, content_settings=blob.content_settings, metadata=self._metadata(blob))
+            return
+        blocks = -(-blob.size // self.block_size)
+        with self.budget.reserve(self.block_size * min(blocks, self.block_concurrency)):
+            logger.info("Copying Blob in blocks", blob_name=source_blob.blob_name, container_name=self.source_container, blocks=blocks)
+            with ThreadPoolExecutor(max_workers=self.block_concurrency) as executor:
+                block_list = list(executor.map(lambda index: self._copy_block(source_blob, dest_blob, blob, index), range(blocks)))
+            dest_blob.commit_block_list(block_list, content_settings=blob.content_settings, metadata=self._metadata(blob))
+
+    def _destination_name(self, blob: BlobProperties) -> str:
+        return f"{self.destination_directory}/{blob.name.split('/')[-1]}"
+
+    def _move(self, blob: BlobProperties) -> None:
+        """Copy a blob to the destination, then delete the source when moving."""
+        logger.info("Processing Blob", blob_name=blob.name, container_name=self.source_container)
+        source_blob = self.source_client.get_blob_client(
+            container=self.source_container,
+            blob=blob.name,
+        )
+        dest_blob = self.destination_client.get_blob_client(
+            container=self.destination_container,
+            blob=self._destination_name(blob),
+        )
+        if self.server_side:
+            logger.info("Copying Blob", blob_name=blob.name, container_name=self.source_container)
+        if not self.server_side or not self._server_side_copy(source_blob, dest_blob, blob):
+            self._stream_copy(source_blob, dest_blob, blob)
+
+    def _delete_one(self, container_client: ContainerClient, blob: BlobProperties) -> int:
+        """Delete a single source blob unless it changed since being copied, returning the response status."""
+        try:
+            container_client.delete_blob(blob.name, etag=blob.etag, match_condition=MatchConditions.IfNotModified)
+        except HttpResponseError as e:
+            return e.status_code
+        return 202
+
+    def _delete(self) -> None:
+        """Delete the sources of copied blobs in a single batch request, unless they changed since being copied."""
+        blobs, self._deletions = self._deletions, []
+        if not blobs:
+            return
+        logger.info("Deleting Blobs", blobs=len(blobs), container_name=self.source_container)
+        container_client = self.source_client.get_container_client(container=self.source_container)
+        conditions = [{"name": blob.name, "etag": blob.etag, "match_condition": MatchConditions.IfNotModified} for blob in blobs]
+        try:
+            responses = list(container_client.delete_blobs(*conditions, raise_on_any_failure=False))
+        except HttpResponseError as e:
+            logger.warning("Batch delete failed, deleting Blobs individually", error=e.reason or str(e))
+            statuses = [self._delete_one(container_client, blob) for blob in blobs]
+        else:
+            statuses = [response.status_code for response in responses]
+        for blob, status in zip(blobs, statuses, strict=True):
+            if status not in (202, 404):
+                logger.error("Failed to delete Blob", blob_name=blob.name, container_name=self.source_container, status=status)
+                self.failed.append(blob.name)
+            else:
+                self.checkpoint.record(blob)
+
+    def _done(self, blob: BlobProperties, future: Future) -> None:
+        """Record the outcome of moving a blob, so one failure does not stop the rest.
+
+        When moving, the source is queued for deletion and only recorded in the checkpoint once deleted.
+        """
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed to move Blob", blob_name=blob.name, container_name=self.source_container, error=str(error))
+            self.failed.append(blob.name)
+            return
+        self.transferred += 1
+        self.transferred_bytes += blob.size
+        if self.mode == "move":
+            self._deletions.append(blob)
+            if len(self._deletions) >= BATCH_SIZE:
+                self._delete()
+        else:
+            self.checkpoint.record(blob)
+
+    def _list_source(self) -> Iterator[BlobProperties]:
+        """List the blobs under the source directory.
+
+        Sub-directories are listed by separate threads at once, which is much faster than a single listing for
+        directories holding millions of blobs.
+        """
+        container_client = self.source_client.get_container_client(container=self.source_container)
+        prefix = self.source_directory + "/"
+        if self.list_concurrency <= 1:
+            yield from container_client.list_blobs(name_starts_with=prefix, include=["metadata"])
+            return
+        sub_prefixes = []
+        for item in container_client.walk_blobs(name_starts_with=prefix, include=["metadata"], delimiter="/"):
+            if isinstance(item, BlobPrefix):
+                sub_prefixes.append(item.name)
+            else:
+                yield item
+        yield from self._list_concurrently(container_client, sub_prefixes)
+
+    def _offer(self, results: queue.Queue, item: BlobProperties | Exception | None, stop: threading.Event) -> None:
+        """Put an item on a queue unless the consumer has stopped reading."""
+        while not stop.is_set():
+            with suppress(queue.Full):
+                results.put(item, timeout=1)
+                return
+
+    def _enumerate(self, container_client: ContainerClient, sub_prefix: str, results: queue.Queue, stop: threading.Event) -> None:
+        """List the blobs under a prefix onto a queue, followed by None once done."""
+        try:
+            for blob in container_client.list_blobs(name_starts_with=sub_prefix, include=["metadata"]):
+                if stop.is_set():
+                    # stop paging through the rest of the prefix once the consumer has gone away
+                    break
+                self._offer(results, blob, stop)
+        except Exception as e:  # noqa: BLE001
+            self._offer(results, e, stop)
+        finally:
+            self._offer(results, None, stop)
+
+    def _list_concurrently(self, container_client: ContainerClient, sub_prefixes: list[str]) -> Iterator[BlobProperties]:
+        """List several prefixes at once, yielding blobs as they arrive."""
+        results: queue.Queue[BlobProperties | Exception | None] = queue.Queue(maxsize=BATCH_SIZE * self.list_concurrency)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.list_concurrency)
+        try:
+            for sub_prefix in sub_prefixes:
+                executor.submit(self._enumerate, container_client, sub_prefix, results, stop)
+            remaining = len(sub_prefixes)
+            while remaining:
+                item = results.get()
+                if item is None:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            executor.shutdown(cancel_futures=True)
+
+    def _wanted(self, blob: BlobProperties, destination: dict[str, BlobProperties]) -> bool:
+        """Return True if a blob needs transferring."""
+        if self.checkpoint.done(blob) or (self.mode == "sync" and self._identical(blob, destination.get(self._destination_name(blob)))):
+            self.skipped += 1
+            return False
+        if self.dry_run:
+            logger.info("Would transfer Blob", blob_name=blob.name, container_name=self.source_container, size=blob.size)
+            self.transferred += 1
+            self.transferred_bytes += blob.size
+            return False
+        return True
 
     def run(self) -> None:
-        """Copy blobs from one Storage Account to another."""
-        for blob in self.source_client.get_container_client(container=self.source_container).list_blobs():
-            if blob.name.startswith(self.source_directory + "/"):
-                blob_name = blob.name.split("/")[-1]
-                logger.info("Processing Blob", blob_name=blob.name, container_name=self.source_container)
-                source_blob = self.source_client.get_blob_client(
-                    container=self.source_container,
-                    blob=blob.name,
-                )
-                dest_blob = self.destination_client.get_blob_client(
-                    container=self.destination_container,
-                    blob=f"{self.destination_directory}/{blob_name}",
-                )
-                logger.info("Downloading Blob", blob_name=blob.name, container_name=self.source_container)
-                fo = io.BytesIO()
-                source_blob.download_blob().readinto(fo)
-                fo.seek(0)
-                logger.info(
-                    "Uploading Blob",
-                    blob_name=f"{self.destination_directory}/{blob_name}",
-                    container_name=self.destination_container,
-                )
-                dest_blob.upload_blob(fo)
-                logger.info("Deleting Blob", blob_name=blob.name, container_name=self.source_container)
-                source_blob.delete_blob()
+        """Copy blobs from one Storage Account to another, several at a time.
+
+        Blobs that fail to copy are left in place and listed in failed once the run completes.
+        """
+        destination = {}
+        if self.mode == "sync":
+            destination_container = self.destination_client.get_container_client(container=self.destination_container)
+            destination = {blob.name: blob for blob in destination_container.list_blobs(name_starts_with=self.destination_directory + "/", include=["metadata"])}
+        pending: dict[Future, BlobProperties] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for blob in self._list_source():
+                if self._wanted(blob, destination):
+                    if len(pending) >= self.concurrency * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._done(pending.pop(future), future)
+                    pending[executor.submit(self._move, blob)] = blob
+            for future in wait(pending).done:
+                self._done(pending.pop(future), future)
+        self._delete()
+        logger.info(
+            "Finished transferring Blobs",
+            mode=self.mode,
+            dry_run=self.dry_run,
+            transferred=self.transferred,
+            transferred_bytes=self.transferred_bytes,
+            skipped=self.skipped,
+            failed=len(self.failed),
+            container_name=self.source_container,
+        )
@@ -1,16 +1,48 @@
 """Hacks for Mastercard SFTP."""
 
-import io
+from collections.abc import Iterable
 
 from azure.storage.blob import BlobServiceClient
 
+from kiroshi.storage.upload import BlockBlobWriter
+
+SPEND_AMOUNT = slice(518, 518 + 12)
+
+
+def _lf(records: bytes) -> bytes:
+    if b"\r" not in records:
+        return records
+    return records.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def _route(records: list[bytes], settlement_file: BlockBlobWriter, refund_file: BlockBlobWriter) -> None:
+    settlements = []
+    refunds = []
+    for record in records:
+        if record[:1] != b"D":
+            # non-data records get written to both files
+            settlements.append(record)
+            refunds.append(record)
+        elif int(record[SPEND_AMOUNT]) >= 0:
+            # data records get written to the appropriate file based on the spend amount
+            settlements.append(record)
+        else:
+            refunds.append(record)
+    # line endings are normalised to LF, as the files were always written out
+    if settlements:
+        settlement_file.write(_lf(b"".join(settlements)))
+    if refunds:
+        refund_file.write(_lf(b"".join(refunds)))
+
 
 def _mastercard(
     blob_client: BlobServiceClient,
     blob_container: str,
     blob_directory: str,
     filename: str,
-    fo: io.BytesIO,
+    blocks: Iterable[bytes],
+    block_size: int = 8 * 1024 * 1024,
+    block_concurrency: int = 4,
 ) -> None:
     settlement_client = blob_client.get_blob_client(
         container=blob_container,
@@ -21,22 +53,15 @@ def _mastercard(
         blob=f"{blob_directory}-refund/{filename}",
     )
 
-    content = io.TextIOWrapper(fo, encoding="utf-8")
-    settlement_file = io.StringIO()
-    refund_file = io.StringIO()
-
-    for line in content:
-        if line[0] != "D":
-            # non-data records get written to both files
-            settlement_file.write(line)
-            refund_file.write(line)
-        else:
-            # data records get written to the appropriate file based on the spend amount
-            spend_amount = int(line[slice(518, 518 + 12)])
-            file = settlement_file if spend_amount >= 0 else refund_file
-            file.write(line)
-
-    settlement_file.seek(0)
-    settlement_client.upload_blob(settlement_file.read())
-    refund_file.seek(0)
-    refund_client.upload_blob(refund_file.read())
+    with (
+        BlockBlobWriter(settlement_client, block_size, block_concurrency) as settlement_file,
+        BlockBlobWriter(refund_client, block_size, block_concurrency) as refund_file,
+    ):
+        # records are routed as raw bytes, a partial record at the end of a block waits for the next one
+        remainder = b""
+        for block in blocks:
+            records = (remainder + block).splitlines(keepends=True)
+            remainder = records.pop() if records and not records[-1].endswith(b"\n") else b""
+            _route(records, settlement_file, refund_file)
+        if remainder:
+            _route([remainder], settlement_file, refund_file)
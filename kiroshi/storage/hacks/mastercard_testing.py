@@ -1,6 +1,6 @@
 """Mastercard Hacks, now we added file deletion."""
 
-import io
+from collections.abc import Iterable
 from pathlib import Path
 
 import paramiko
@@ -16,13 +16,17 @@ def _mastercard_testing(
     blob_container: str,
     blob_directory: str,
     filename: str,
-    fo: io.BytesIO,
+    blocks: Iterable[bytes],
+    block_size: int = 8 * 1024 * 1024,
+    block_concurrency: int = 4,
 ) -> None:
     hacks_mastercard(
         blob_client=blob_client,
         blob_container=blob_container,
         blob_directory=blob_directory,
         filename=filename,
-        fo=fo,
+        blocks=blocks,
+        block_size=block_size,
+        block_concurrency=block_concurrency,
     )
     sftp_client.remove(f"{sftp_path}/{filename}")
@@ -35,5 +35,9 @@ def _wasabi(
         chunk_client.upload_blob(chunk_content.read())
 
     today = pendulum.today().format("YYYY/MM/DD")
-    sftp_client.mkdir(f"/archive/{today}")
+    try:
+        sftp_client.mkdir(f"/archive/{today}")
+    except OSError:
+        # Created by an earlier file in this run, or by another worker transferring at the same time
+        sftp_client.stat(f"/archive/{today}")
     sftp_client.rename(f"{sftp_path}/{filename}", f"/archive/{today}/{filename}")
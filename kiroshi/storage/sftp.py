@@ -1,17 +1,30 @@
 """General Purpose SFTP to Blob Storage Utility."""
 
+import hashlib
 import io
+import socket
+import stat
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any
 
 import paramiko
+import pendulum
 from azure.storage.blob import BlobServiceClient
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_fixed
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from tenacity import Retrying, stop_after_attempt, wait_fixed
 
+from kiroshi.database import SFTPTransfers, engine
 from kiroshi.settings import settings
 from kiroshi.storage.hacks.mastercard import _mastercard as hacks_mastercard
 from kiroshi.storage.hacks.mastercard_testing import _mastercard_testing as hacks_mastercard_testing
 from kiroshi.storage.hacks.wasabi import _wasabi as hacks_wasabi
+from kiroshi.storage.upload import BlockBlobWriter
 
 
 class SFTP:
@@ -26,6 +39,19 @@ class SFTP:
         sftp_path: Path,
         blob_path: str,
         hacks: str | None = None,
+        concurrency: int = 4,
+        block_size: int = 8 * 1024 * 1024,
+        block_concurrency: int = 4,
+        *,
+        incremental: bool = False,
+        window_size: int = settings.sftp_window_size,
+        max_packet_size: int = settings.sftp_max_packet_size,
+        keepalive: int = settings.sftp_keepalive,
+        compression: bool = settings.sftp_compression,
+        ciphers: list[str] = settings.sftp_ciphers,
+        prefetch_requests: int | None = settings.sftp_prefetch_requests,
+        connect_attempts: int = settings.sftp_connect_attempts,
+        connect_wait: float = settings.sftp_connect_wait,
     ) -> None:
         """Initialize the SFTP class.
 
@@ -37,6 +63,18 @@ class SFTP:
             sftp_path (Path): SFTP Server Path.
             blob_path (str): Location to store retrieved files.
             hacks (str): Enable Provider specific hacks.
+            concurrency (int): Number of files transferred at once, each over its own SFTP channel.
+            block_size (int): Size of the blocks files are streamed to Blob Storage in.
+            block_concurrency (int): Number of blocks of a single file uploaded at once.
+            incremental (bool): Skip files already recorded in the sftp_transfers ledger with the same size and mtime.
+            window_size (int): SSH channel window size, raise it on high-latency links.
+            max_packet_size (int): Largest SSH packet the server may send.
+            keepalive (int): Seconds between SSH keepalives, 0 to disable.
+            compression (bool): Request SSH compression.
+            ciphers (list[str]): Ciphers to prefer, in order, ahead of paramiko's defaults.
+            prefetch_requests (int): Read requests in flight per file, None for no limit.
+            connect_attempts (int): Attempts to connect before giving up.
+            connect_wait (float): Seconds between connection attempts.
 
         Returns:
             None
@@ -50,9 +88,38 @@ class SFTP:
         self.blob_client = BlobServiceClient.from_connection_string(settings.blob_storage_account_dsn)
         self.blob_container, self.blob_directory = blob_path.split(":")
         self.hacks = hacks
+        self.concurrency = concurrency
+        self.block_size = block_size
+        self.block_concurrency = block_concurrency
+        self.incremental = incremental
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.keepalive = keepalive
+        self.compression = compression
+        self.ciphers = ciphers
+        self.prefetch_requests = prefetch_requests
+        self.connect_attempts = connect_attempts
+        self.connect_wait = connect_wait
+        self.failed: list[str] = []
+        self._local = threading.local()
+        self._channels: list[paramiko.SFTPClient] = []
+        self._channels_lock = threading.Lock()
+
+    def _transport(self, sock: socket.socket, **kwargs: Any) -> paramiko.Transport:  # noqa: ANN401
+        """Create the SSH transport with the configured window, packet size and cipher preference."""
+        transport = paramiko.Transport(sock, default_window_size=self.window_size, default_max_packet_size=self.max_packet_size, **kwargs)
+        if self.ciphers:
+            options = transport.get_security_options()
+            options.ciphers = [cipher for cipher in self.ciphers if cipher in options.ciphers] + [cipher for cipher in options.ciphers if cipher not in self.ciphers]
+        return transport
+
+    def _sftp_client(self, transport: paramiko.Transport) -> paramiko.SFTPClient:
+        return paramiko.SFTPClient.from_transport(transport, window_size=self.window_size, max_packet_size=self.max_packet_size)
 
-    @retry(stop=stop_after_attempt(5), wait=wait_fixed(30))
     def _connect(self) -> paramiko.SFTPClient:
+        return Retrying(stop=stop_after_attempt(self.connect_attempts), wait=wait_fixed(self.connect_wait))(self._open)
+
+    def _open(self) -> paramiko.SFTPClient:
         logger.info(
             "Connecting to SFTP Server",
             host=self.sftp_host,
@@ -69,49 +136,171 @@ class SFTP:
             username=self.sftp_user,
             pkey=key,
             disabled_algorithms={"pubkeys": ["rsa-sha2-256", "rsa-sha2-512"]},
+            compress=self.compression,
+            transport_factory=self._transport,
         )
-        return ssh.open_sftp()
+        transport = ssh.get_transport()
+        transport.set_keepalive(self.keepalive)
+        logger.info("Connected to SFTP Server", cipher=transport.remote_cipher, compression=transport.remote_compression)
+        return self._sftp_client(transport)
 
-    def _copy_to_blob_storage(self, filename: str, fo: io.BytesIO) -> None:
+    def _read(self, sftp_client: paramiko.SFTPClient, path: str, size: int, checksum: "hashlib._Hash") -> Iterator[bytes]:
+        """Yield a file block by block, adding each block to checksum.
+
+        Each block is read with paramiko's prefetching, so the download stays pipelined while at most one block is
+        buffered, unlike prefetching the whole file which buffers everything the consumer has not caught up with.
+        """
+        with sftp_client.open(path, "rb") as f:
+            for offset in range(0, size, self.block_size):
+                for data in f.readv([(offset, min(self.block_size, size - offset))], max_concurrent_prefetch_requests=self.prefetch_requests):
+                    checksum.update(data)
+                    yield data
+
+    def _stream_to_blob_storage(self, filename: str, blocks: Iterable[bytes]) -> None:
+        """Stream a file to Blob Storage block by block, uploading while the download is still running.
+
+        Memory use stays around block_size * (block_concurrency + 2) per file regardless of its size.
+        """
         blob_client = self.blob_client.get_blob_client(
             container=self.blob_container,
             blob=f"{self.blob_directory}/{filename}",
         )
-        blob_client.upload_blob(fo)
+        with BlockBlobWriter(blob_client, self.block_size, self.block_concurrency) as writer:
+            for data in blocks:
+                writer.write(data)
+
+    def _channel(self, sftp_client: paramiko.SFTPClient) -> paramiko.SFTPClient:
+        """Return this thread's SFTP channel, opening it on the existing connection on first use."""
+        channel = getattr(self._local, "sftp_client", None)
+        if channel is None:
+            channel = self._sftp_client(sftp_client.get_channel().get_transport())
+            self._local.sftp_client = channel
+            with self._channels_lock:
+                self._channels.append(channel)
+        return channel
+
+    def _ingested(self) -> set[tuple[str, int, int]]:
+        """Return the path, size and mtime of every file already ingested from sftp_path."""
+        with Session(engine) as session:
+            rows = session.execute(
+                select(SFTPTransfers.path, SFTPTransfers.size, SFTPTransfers.mtime).where(
+                    SFTPTransfers.host == self.sftp_host,
+                    SFTPTransfers.path.startswith(f"{self.sftp_path}/", autoescape=True),
+                ),
+            )
+            return set(rows.tuples())
+
+    def _record(self, attr: paramiko.SFTPAttributes, checksum: str) -> None:
+        """Add an ingested file to the ledger."""
+        with Session(engine) as session:
+            session.add(
+                SFTPTransfers(
+                    host=self.sftp_host,
+                    path=f"{self.sftp_path}/{attr.filename}",
+                    size=attr.st_size,
+                    mtime=attr.st_mtime,
+                    checksum=checksum,
+                    last_updated=pendulum.now(),
+                ),
+            )
+            session.commit()
+
+    def _transfer(self, sftp_client: paramiko.SFTPClient, filename: str) -> tuple[int, str]:
+        """Copy a file to Blob Storage and log its throughput, returning its size and SHA-256."""
+        started = time.perf_counter()
+        size, checksum = self._copy(self._channel(sftp_client), filename)
+        seconds = time.perf_counter() - started
+        logger.info("Transferred file", filename=filename, bytes=size, seconds=round(seconds, 2), mb_per_second=round(size / seconds / 1_000_000, 2))
+        return size, checksum
+
+    def _copy(self, sftp_client: paramiko.SFTPClient, filename: str) -> tuple[int, str]:
+        """Copy a file to Blob Storage, applying any provider specific hacks."""
+        path = f"{self.sftp_path}/{filename}"
+        size = sftp_client.stat(path).st_size
+        checksum = hashlib.sha256()
+        blocks = self._read(sftp_client, path, size, checksum)
+        match self.hacks:
+            case "mastercard":
+                hacks_mastercard(
+                    blob_client=self.blob_client,
+                    blob_container=self.blob_container,
+                    blob_directory=self.blob_directory,
+                    filename=filename,
+                    blocks=blocks,
+                    block_size=self.block_size,
+                    block_concurrency=self.block_concurrency,
+                )
+            case "mastercard_testing":
+                hacks_mastercard_testing(
+                    sftp_client=sftp_client,
+                    sftp_path=self.sftp_path,
+                    blob_client=self.blob_client,
+                    blob_container=self.blob_container,
+                    blob_directory=self.blob_directory,
+                    filename=filename,
+                    blocks=blocks,
+                    block_size=self.block_size,
+                    block_concurrency=self.block_concurrency,
+                )
+            case "wasabi":
+                fo = io.BytesIO()
+                for data in blocks:
+                    fo.write(data)
+                fo.seek(0)
+                hacks_wasabi(
+                    sftp_client=sftp_client,
+                    sftp_path=self.sftp_path,
+                    blob_client=self.blob_client,
+                    blob_container=self.blob_container,
+                    blob_directory=self.blob_directory,
+                    filename=filename,
+                    fo=fo,
+                )
+            case _:
+                self._stream_to_blob_storage(filename, blocks)
+        return size, checksum.hexdigest()
 
     def run(self) -> None:
-        """Execute SFTP Actions."""
+        """Execute SFTP Actions, transferring several files at once.
+
+        A file that fails to transfer is logged and listed in failed, and is left on the SFTP Server. In incremental
+        mode files whose path, size and mtime are already in the ledger are skipped without being downloaded.
+        """
+        started = time.perf_counter()
+        transferred = 0
         sftp_client = self._connect()
-        for filename in sftp_client.listdir(self.sftp_path):
-            fo = io.BytesIO()
-            sftp_client.getfo(f"{self.sftp_path}/{filename}", fo)
-            fo.seek(0)
-            match self.hacks:
-                case "mastercard":
-                    hacks_mastercard(
-                        blob_client=self.blob_client,
-                        blob_container=self.blob_container,
-                        blob_directory=self.blob_directory,
-                        filename=filename,
-                        fo=fo,
-                    )
-                case "mastercard_testing":
-                    hacks_mastercard_testing(
-                        blob_client=self.blob_client,
-                        blob_container=self.blob_container,
-                        blob_directory=self.blob_directory,
-                        filename=filename,
-                        fo=fo,
-                    )
-                case "wasabi":
-                    hacks_wasabi(
-                        sftp_client=sftp_client,
-                        sftp_path=self.sftp_path,
-                        blob_client=self.blob_client,
-                        blob_container=self.blob_container,
-                        blob_directory=self.blob_directory,
-                        filename=filename,
-                        fo=fo,
-                    )
-                case _:
-                    self._copy_to_blob_storage(filename=filename, fo=fo)
+        files = [attr for attr in sftp_client.listdir_attr(str(self.sftp_path)) if not stat.S_ISDIR(attr.st_mode or 0)]
+        skipped = 0
+        if self.incremental:
+            ingested = self._ingested()
+            pending = [attr for attr in files if (f"{self.sftp_path}/{attr.filename}", attr.st_size, attr.st_mtime) not in ingested]
+            skipped = len(files) - len(pending)
+            files = pending
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {executor.submit(self._transfer, sftp_client, attr.filename): attr for attr in files}
+                for future in as_completed(futures):
+                    attr = futures[future]
+                    try:
+                        size, checksum = future.result()
+                        transferred += size
+                        if self.incremental:
+                            self._record(attr, checksum)
+                    except Exception as e:  # noqa: BLE001
+                        logger.error("Failed to transfer file", filename=attr.filename, error=str(e))
+                        self.failed.append(attr.filename)
+        finally:
+            for channel in self._channels:
+                channel.close()
+            sftp_client.close()
+            sftp_client.get_channel().get_transport().close()
+        seconds = time.perf_counter() - started
+        logger.info(
+            "Finished transferring files",
+            files=len(files),
+            skipped=skipped,
+            failed=len(self.failed),
+            bytes=transferred,
+            seconds=round(seconds, 2),
+            mb_per_second=round(transferred / seconds / 1_000_000, 2),
+        )
@@ -0,0 +1,93 @@
+"""Streaming Block Blob Uploads."""
+
+import base64
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import TracebackType
+
+from azure.storage.blob import BlobBlock, BlobClient, ContentSettings
+
+
+class BlockBlobWriter:
+    """Writable stream that uploads to a block blob in fixed-size blocks while data is still being written.
+
+    Blocks are staged in the background, at most concurrency at a time, and committed on close, so memory use is
+    bounded by block_size * (concurrency + 1) however much is written. Content that never fills a block is
+    uploaded in a single request instead. Used as a context manager, nothing is committed if the block raises.
+    """
+
+    def __init__(self, blob_client: BlobClient, block_size: int = 8 * 1024 * 1024, concurrency: int = 4, content_settings: ContentSettings | None = None) -> None:
+        """Initialize the BlockBlobWriter class.
+
+        Args:
+            blob_client (BlobClient): Blob to write to, replacing any existing content.
+            block_size (int): Size of each staged block.
+            concurrency (int): Number of blocks staged at once.
+            content_settings (ContentSettings): Content settings for the committed blob.
+
+        """
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.content_settings = content_settings
+        self.size = 0
+        self._buffer = bytearray()
+        self._blocks: list[BlobBlock] = []
+        self._futures: list[Future] = []
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def __enter__(self) -> "BlockBlobWriter":
+        """Return the writer."""
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None) -> None:
+        """Commit the blob, or abandon the staged blocks if an exception was raised."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _check(self) -> None:
+        """Raise the first error from a finished block upload."""
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def _stage(self, data: bytes) -> None:
+        """Upload a block in the background, waiting for a free slot first."""
+        self._check()
+        self._slots.acquire()
+        block_id = base64.b64encode(f"{len(self._blocks):032d}".encode()).decode()
+        self._blocks.append(BlobBlock(block_id=block_id))
+        future = self._executor.submit(self.blob_client.stage_block, block_id=block_id, data=data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def write(self, data: bytes) -> int:
+        """Buffer data, staging a block each time a full block is buffered."""
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._stage(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return len(data)
+
+    def close(self) -> None:
+        """Upload any remaining data and commit the blob."""
+        try:
+            if not self._blocks:
+                self.blob_client.upload_blob(bytes(self._buffer), overwrite=True, content_settings=self.content_settings)
+                return
+            if self._buffer:
+                self._stage(bytes(self._buffer))
+            for future in self._futures:
+                future.result()
+            self.blob_client.commit_block_list(self._blocks, content_settings=self.content_settings)
+        finally:
+            self._buffer.clear()
+            self._executor.shutdown()
+
+    def abort(self) -> None:
+        """Stop uploading, leaving any staged blocks uncommitted for Blob Storage to discard."""
+        self._buffer.clear()
+        self._executor.shutdown(cancel_futures=True)
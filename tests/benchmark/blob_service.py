@@ -0,0 +1,148 @@
+"""In-Process Stand-In for the Azure Blob Storage REST API."""
+
+import asyncio
+import base64
+import hashlib
+from dataclasses import dataclass
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+ACCOUNT = "devstoreaccount1"
+ACCOUNT_KEY = base64.b64encode(b"kiroshi-benchmark-account-key-00").decode()
+API_VERSION = "2025-01-05"
+LAST_MODIFIED = formatdate(1700000000, usegmt=True)
+
+
+@dataclass(slots=True)
+class FakeBlob:
+    """A blob held by the FakeBlobService."""
+
+    content: bytes
+    etag: str
+    content_type: str
+
+
+class FakeBlobService:
+    """Serves enough of the Blob Storage REST API for the Azure SDK to download, list and check blobs.
+
+    Blobs of the same size share their content so that large object counts stay cheap, every blob still has its
+    own ETag. Each request is delayed by the configured latency to simulate the round trip to a Storage Account.
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 5000) -> None:
+        """Initialize the FakeBlobService class.
+
+        Args:
+            latency (float): Seconds to wait before answering each request.
+            page_size (int): Maximum number of blobs returned per listing page.
+
+        """
+        self.latency = latency
+        self.page_size = page_size
+        self.blobs: dict[tuple[str, str], FakeBlob] = {}
+        self.requests: dict[str, int] = {}
+        self._payloads: dict[int, bytes] = {}
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+    @property
+    def dsn(self) -> str:
+        """Connection String for the running service."""
+        return f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT};AccountKey={ACCOUNT_KEY};BlobEndpoint=http://127.0.0.1:{self.port}/{ACCOUNT};"
+
+    def put(self, container: str, name: str, size: int, content_type: str = "application/octet-stream") -> None:
+        """Store a blob of the given size."""
+        if size not in self._payloads:
+            self._payloads[size] = hashlib.shake_256(str(size).encode()).digest(size)
+        etag = '"0x' + hashlib.md5(f"{container}/{name}/{size}".encode()).hexdigest()[:15].upper() + '"'  # noqa: S324
+        self.blobs[(container, name)] = FakeBlob(content=self._payloads[size], etag=etag, content_type=content_type)
+
+    async def start(self, port: int = 0) -> None:
+        """Start listening on localhost, on a random port by default."""
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        """Stop the service."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """Route a request by path depth and query parameters."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        _, container, name = [*request.path.lstrip("/").split("/", 2), "", ""][:3]
+        if not container:
+            return self._count("account", web.Response(headers={"x-ms-version": API_VERSION, "x-ms-sku-name": "Standard_LRS", "x-ms-account-kind": "StorageV2"}))
+        if not name:
+            return self._count("list", self._list(container, request.query))
+        blob = self.blobs.get((container, name))
+        if blob is None:
+            return self._count("missing", self._error(404, "BlobNotFound", head=request.method == "HEAD"))
+        if request.headers.get("If-None-Match") == blob.etag:
+            return self._count("not_modified", web.Response(status=304, headers=self._properties(blob)))
+        if request.method == "HEAD":
+            return self._count("head", web.Response(headers={**self._properties(blob), "Content-Length": str(len(blob.content))}))
+        return self._count("get", self._download(blob, request.headers.get("x-ms-range") or request.headers.get("Range")))
+
+    def _count(self, kind: str, response: web.StreamResponse) -> web.StreamResponse:
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        return response
+
+    def _properties(self, blob: FakeBlob) -> dict[str, str]:
+        return {
+            "ETag": blob.etag,
+            "Last-Modified": LAST_MODIFIED,
+            "Content-Type": blob.content_type,
+            "Accept-Ranges": "bytes",
+            "x-ms-blob-type": "BlockBlob",
+            "x-ms-version": API_VERSION,
+        }
+
+    def _error(self, status: int, code: str, *, head: bool = False, headers: dict[str, str] | None = None) -> web.Response:
+        headers = {"x-ms-error-code": code, "x-ms-version": API_VERSION, **(headers or {})}
+        if head:
+            return web.Response(status=status, headers=headers)
+        body = f'<?xml version="1.0" encoding="utf-8"?><Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        return web.Response(status=status, text=body, content_type="application/xml", headers=headers)
+
+    def _download(self, blob: FakeBlob, range_: str | None) -> web.Response:
+        size = len(blob.content)
+        if not range_:
+            return web.Response(body=blob.content, headers=self._properties(blob))
+        first, _, last = range_.removeprefix("bytes=").partition("-")
+        start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        if start >= size:
+            return self._error(416, "InvalidRange", headers={"Content-Range": f"bytes */{size}"})
+        headers = {**self._properties(blob), "Content-Range": f"bytes {start}-{end}/{size}"}
+        return web.Response(status=206, body=blob.content[start : end + 1], headers=headers)
+
+    def _list(self, container: str, query: dict[str, str]) -> web.Response:
+        prefix = query.get("prefix", "")
+        marker = query.get("marker", "")
+        limit = min(int(query.get("maxresults", self.page_size)), self.page_size)
+        names = sorted(name for (blob_container, name) in self.blobs if blob_container == container and name.startswith(prefix) and name > marker)
+        page, rest = names[:limit], names[limit:]
+        items = "".join(
+            f"<Blob><Name>{escape(name)}</Name><Properties>"
+            f"<Last-Modified>{LAST_MODIFIED}</Last-Modified><Etag>{blob.etag}</Etag><Content-Length>{len(blob.content)}</Content-Length>"
+            f"<Content-Type>{blob.content_type}</Content-Type><BlobType>BlockBlob</BlobType>"
+            "</Properties></Blob>"
+            for name, blob in ((name, self.blobs[(container, name)]) for name in page)
+        )
+        next_marker = escape(page[-1]) if rest else ""
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<EnumerationResults ServiceEndpoint="http://127.0.0.1:{self.port}/{ACCOUNT}/" ContainerName="{escape(container)}">'
+            f"<Prefix>{escape(prefix)}</Prefix><MaxResults>{limit}</MaxResults><Blobs>{items}</Blobs><NextMarker>{next_marker}</NextMarker>"
+            "</EnumerationResults>"
+        )
+        return web.Response(text=body, content_type="application/xml", headers={"x-ms-version": API_VERSION})
@@ -0,0 +1,332 @@
+"""Load Test Benchmarks for the Image Server.
+
+Runs the image server in a subprocess against a FakeBlobService in this process, drives concurrent load at it and
+reports throughput, latency percentiles and the server's peak RSS for each workload:
+
+    cold     every request is for a blob that has not been requested before
+    warm     requests cycle over a small set of blobs that have already been fetched once
+    missing  every request is for a blob that does not exist
+
+Each workload gets a freshly started server so caches and memory usage do not carry over. Results are written as
+JSON, pass a previous result file to --compare to check for regressions between versions:
+
+    python -m tests.benchmark.image_server --output before.json
+    python -m tests.benchmark.image_server --compare before.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import aiohttp
+import click
+
+from tests.benchmark.blob_service import FakeBlobService
+
+CONTAINER = "kiroshi-benchmark"
+WORKLOADS = ("cold", "warm", "missing")
+UNITS = {"k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+@dataclass
+class Result:
+    """Measurements for a single workload."""
+
+    workload: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    megabytes_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    peak_rss_mib: float | None
+    upstream_requests: dict[str, int] = field(default_factory=dict)
+
+
+def parse_size(value: str) -> int:
+    """Parse a size such as 512, 64k or 4M into bytes."""
+    value = value.strip().lower().removesuffix("ib").removesuffix("b")
+    if value and value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def free_port() -> int:
+    """Return a currently unused TCP port on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss(pid: int) -> int | None:
+    """Return the resident memory in bytes of a process and all of its descendants, or None where /proc is unavailable."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+        children = [int(child) for task in Path(f"/proc/{pid}/task").iterdir() for child in (task / "children").read_text().split()]
+    except OSError:
+        return None
+    total = next((int(line.split()[1]) * 1024 for line in status.splitlines() if line.startswith("VmRSS:")), 0)
+    return total + sum(rss(child) or 0 for child in children)
+
+
+def git_revision() -> str | None:
+    """Return a description of the checked out revision."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()  # noqa: S603, S607
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ServerProcess:
+    """Image server running in a subprocess."""
+
+    def __init__(self, dsn: str, workers: int, environment: dict[str, str]) -> None:
+        """Initialize the ServerProcess class."""
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "kiroshi.server.image.server:app",
+            f"--port={self.port}",
+            f"--workers={workers}",
+            "--no-access-log",
+            "--log-level=warning",
+        ]
+        self.environment = {**os.environ, "BLOB_STORAGE_ACCOUNT_DSN": dsn, "READINESS_INTERVAL": "0.2", **environment}
+        self.process: asyncio.subprocess.Process | None = None
+
+    async def __aenter__(self) -> "ServerProcess":
+        """Start the server and wait until it reports ready."""
+        self.process = await asyncio.create_subprocess_exec(*self.command, env=self.environment, stdout=subprocess.DEVNULL)
+        async with aiohttp.ClientSession() as session:
+            for _ in range(300):
+                if self.process.returncode is not None:
+                    msg = f"image server exited with status {self.process.returncode}"
+                    raise RuntimeError(msg)
+                try:
+                    async with session.get(f"{self.url}/readyz") as response:
+                        if response.status == 200:  # noqa: PLR2004
+                            return self
+                except aiohttp.ClientConnectionError:
+                    pass
+                await asyncio.sleep(0.1)
+        msg = "image server did not become ready"
+        raise RuntimeError(msg)
+
+    async def __aexit__(self, *_: object) -> None:
+        """Stop the server."""
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+
+
+class Benchmark:
+    """Benchmark Class."""
+
+    def __init__(self, blobs: FakeBlobService, sizes: list[int], requests: int, concurrency: int, objects: int, workers: int, environment: dict[str, str]) -> None:
+        """Initialize the Benchmark class.
+
+        Args:
+            blobs (FakeBlobService): Running blob service to serve from.
+            sizes (list[int]): Blob sizes in bytes, blobs cycle through these.
+            requests (int): Number of timed requests per workload.
+            concurrency (int): Number of requests in flight at once.
+            objects (int): Number of distinct blobs requested by the warm workload.
+            workers (int): Number of server worker processes.
+            environment (dict[str, str]): Extra settings passed to the server.
+
+        """
+        self.blobs = blobs
+        self.sizes = sizes
+        self.requests = requests
+        self.concurrency = concurrency
+        self.objects = objects
+        self.workers = workers
+        self.environment = environment
+
+    def populate(self) -> None:
+        """Upload the blobs used by the cold and warm workloads."""
+        for index in range(self.requests):
+            self.blobs.put(CONTAINER, f"cold/{index}.png", self.sizes[index % len(self.sizes)], "image/png")
+        for index in range(self.objects):
+            self.blobs.put(CONTAINER, f"warm/{index}.png", self.sizes[index % len(self.sizes)], "image/png")
+
+    def paths(self, workload: str) -> tuple[list[str], list[str], int]:
+        """Return the paths to fetch before timing, the paths to time and the expected status code."""
+        if workload == "cold":
+            return [], [f"/content/cold/{index}.png" for index in range(self.requests)], 200
+        if workload == "warm":
+            warm = [f"/content/warm/{index}.png" for index in range(self.objects)]
+            return warm, [warm[index % self.objects] for index in range(self.requests)], 200
+        return [], [f"/content/missing/{index}.png" for index in range(self.requests)], 404
+
+    async def load(self, session: aiohttp.ClientSession, url: str, paths: list[str], expected: int) -> tuple[list[float], int, int]:
+        """Fetch every path with bounded concurrency, returning latencies, error count and bytes received."""
+        queue = iter(paths)
+        latencies: list[float] = []
+        errors = 0
+        received = 0
+
+        async def worker() -> None:
+            nonlocal errors, received
+            for path in queue:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url + path, headers={"container": CONTAINER}) as response:
+                        received += len(await response.read())
+                        errors += response.status != expected
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return latencies, errors, received
+
+    async def run(self, workload: str) -> Result:
+        """Run a workload against a freshly started server."""
+        prime, paths, expected = self.paths(workload)
+        async with ServerProcess(self.blobs.dsn, self.workers, self.environment) as server:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await self.load(session, server.url, prime, expected)
+                self.blobs.requests.clear()
+                peak = 0
+                sampling = True
+
+                async def sample() -> None:
+                    nonlocal peak
+                    while sampling:
+                        peak = max(peak, rss(server.process.pid) or 0)
+                        await asyncio.sleep(0.05)
+
+                sampler = asyncio.create_task(sample())
+                started = time.perf_counter()
+                latencies, errors, received = await self.load(session, server.url, paths, expected)
+                seconds = time.perf_counter() - started
+                sampling = False
+                await sampler
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        return Result(
+            workload=workload,
+            requests=len(latencies),
+            errors=errors,
+            seconds=round(seconds, 3),
+            throughput=round(len(latencies) / seconds, 1),
+            megabytes_per_second=round(received / seconds / 1024**2, 2),
+            p50_ms=round(percentiles[49] * 1000, 2),
+            p95_ms=round(percentiles[94] * 1000, 2),
+            p99_ms=round(percentiles[98] * 1000, 2),
+            max_ms=round(max(latencies) * 1000, 2),
+            peak_rss_mib=round(peak / 1024**2, 1) if peak else None,
+            upstream_requests=dict(self.blobs.requests),
+        )
+
+
+def compare(previous: dict, current: dict, tolerance: float) -> list[str]:
+    """Print the change from a previous run and return the regressions beyond the tolerance."""
+    if previous["parameters"] != current["parameters"]:
+        click.echo(f"warning: parameters differ from {previous.get('revision')}, results may not be comparable", err=True)
+    before = {result["workload"]: result for result in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        baseline = before.get(result["workload"])
+        if baseline is None:
+            continue
+        for metric, higher_is_better in (("throughput", True), ("p99_ms", False), ("peak_rss_mib", False)):
+            old, new = baseline[metric], result[metric]
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            click.echo(f"{result['workload']:<8} {metric:<13} {old:>10} -> {new:<10} {change:+.1%}")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{result['workload']} {metric} {change:+.1%}")
+    return regressions
+
+
+@click.command()
+@click.option("--size", "sizes", multiple=True, default=["64k"], show_default=True, help="Blob size such as 512, 64k or 4M, repeat for a mix of sizes.")
+@click.option("--latency", default=0.02, show_default=True, help="Seconds the fake blob service waits before each response.")
+@click.option("--requests", default=2000, show_default=True, help="Timed requests per workload.")
+@click.option("--concurrency", default=50, show_default=True, help="Requests in flight at once.")
+@click.option("--objects", default=100, show_default=True, help="Distinct blobs requested by the warm workload.")
+@click.option("--workers", default=1, show_default=True, help="Number of server worker processes.")
+@click.option("--workload", "workloads", multiple=True, type=click.Choice(WORKLOADS), default=WORKLOADS, show_default=True, help="Workloads to run.")
+@click.option("-e", "--env", "environment", multiple=True, help="Setting passed to the server as NAME=VALUE, such as IMAGE_SERVER_STREAMING=false.")
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path), help="Write results as JSON to this file.")
+@click.option("--compare", "baseline", type=click.Path(exists=True, dir_okay=False, path_type=Path), help="Previous JSON results to compare against.")
+@click.option("--tolerance", default=0.1, show_default=True, help="Relative change counted as a regression when comparing.")
+def benchmark(
+    sizes: tuple[str, ...],
+    latency: float,
+    requests: int,
+    concurrency: int,
+    objects: int,
+    workers: int,
+    workloads: tuple[str, ...],
+    environment: tuple[str, ...],
+    output: Path | None,
+    baseline: Path | None,
+    tolerance: float,
+) -> None:
+    """Benchmark the image server."""
+    settings = dict(item.split("=", 1) for item in environment)
+    parameters = {
+        "sizes": [parse_size(size) for size in sizes],
+        "latency": latency,
+        "requests": requests,
+        "concurrency": concurrency,
+        "objects": objects,
+        "workers": workers,
+        "environment": settings,
+    }
+
+    async def run() -> list[Result]:
+        blobs = FakeBlobService(latency=latency)
+        await blobs.start()
+        try:
+            bench = Benchmark(blobs, parameters["sizes"], requests, concurrency, objects, workers, settings)
+            bench.populate()
+            results = []
+            for workload in workloads:
+                result = await bench.run(workload)
+                click.echo(
+                    f"{result.workload:<8} {result.throughput:>9} req/s {result.megabytes_per_second:>9} MiB/s  "
+                    f"p50 {result.p50_ms}ms  p95 {result.p95_ms}ms  p99 {result.p99_ms}ms  max {result.max_ms}ms  "
+                    f"rss {result.peak_rss_mib} MiB  errors {result.errors}  upstream {result.upstream_requests}",
+                )
+                results.append(result)
+            return results
+        finally:
+            await blobs.stop()
+
+    current = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": [asdict(result) for result in asyncio.run(run())],
+    }
+    if output is not None:
+        output.write_text(json.dumps(current, indent=2) + "\n")
+    if baseline is not None:
+        regressions = compare(json.loads(baseline.read_text()), current, tolerance)
+        if regressions:
+            click.echo(f"regressions beyond {tolerance:.0%}: {', '.join(regressions)}", err=True)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,95 @@
+"""Tests for the Image Server HTTP Helpers."""
+
+from datetime import UTC, datetime
+
+import pytest
+
+from kiroshi.server.image.http import http_date, if_range_matches, not_modified, parse_range
+
+ETAG = '"0x8DC0A1B2C3D4E5F"'
+LAST_MODIFIED = datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=UTC)
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        ("bytes=0-9", [(0, 9)]),
+        ("bytes=90-", [(90, 99)]),
+        ("bytes=-10", [(90, 99)]),
+        ("bytes=-500", [(0, 99)]),
+        ("bytes=95-200", [(95, 99)]),
+        ("bytes=0-0, 10-19,-1", [(0, 0), (10, 19), (99, 99)]),
+        ("BYTES = 0-9", [(0, 9)]),
+        ("bytes=100-", []),
+        ("bytes=-0", []),
+        ("bytes=100-200, 150-", []),
+    ],
+)
+def test_parse_range(header: str, expected: list[tuple[int, int]]) -> None:
+    """Test satisfiable and unsatisfiable ranges of a 100 byte blob."""
+    assert parse_range(header, 100) == expected  # noqa: S101
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "items=0-9",
+        "bytes=",
+        "bytes=-",
+        "bytes=9-0",
+        "bytes=a-9",
+        "bytes=0-9a",
+        "bytes=0:9",
+        "bytes=²-3",
+        "bytes=0-٣",
+        "bytes=+1-3",
+        "bytes=" + ",".join(["0-0"] * 17),
+    ],
+)
+def test_parse_range_malformed(header: str) -> None:
+    """Test malformed Range headers are ignored rather than raising."""
+    assert parse_range(header, 100) is None  # noqa: S101
+
+
+def test_parse_range_empty_blob() -> None:
+    """Test no range of an empty blob is satisfiable."""
+    assert parse_range("bytes=-5", 0) == []  # noqa: S101
+    assert parse_range("bytes=0-", 0) == []  # noqa: S101
+
+
+@pytest.mark.parametrize(
+    ("if_range", "expected"),
+    [
+        (None, True),
+        (ETAG, True),
+        ('"0xOTHER"', False),
+        (f"W/{ETAG}", False),
+        (http_date(LAST_MODIFIED), True),
+        ("Tue, 02 Jan 2024 03:04:06 GMT", False),
+        ("not a date", False),
+    ],
+)
+def test_if_range_matches(if_range: str | None, expected: bool) -> None:  # noqa: FBT001
+    """Test If-Range only matches the exact ETag or Last-Modified date."""
+    assert if_range_matches(ETAG, LAST_MODIFIED, if_range) is expected  # noqa: S101
+
+
+@pytest.mark.parametrize(
+    ("if_none_match", "if_modified_since", "expected"),
+    [
+        (None, None, False),
+        (ETAG, None, True),
+        ("*", None, True),
+        (f'"0xOTHER", W/{ETAG}', None, True),
+        ('"0xOTHER"', None, False),
+        ('"0xOTHER"', http_date(LAST_MODIFIED), False),
+        (None, "Tue, 02 Jan 2024 03:04:05 GMT", True),
+        (None, "Tue, 02 Jan 2024 03:04:04 GMT", False),
+        (None, "Wed, 03 Jan 2024 00:00:00 GMT", True),
+        (None, "Tuesday, 02-Jan-24 03:04:05 GMT", True),
+        (None, "not a date", False),
+    ],
+)
+def test_not_modified(if_none_match: str | None, if_modified_since: str | None, expected: bool) -> None:  # noqa: FBT001
+    """Test If-None-Match takes precedence over If-Modified-Since, which ignores sub-second precision."""
+    assert not_modified(ETAG, LAST_MODIFIED, if_none_match, if_modified_since) is expected  # noqa: S101
@@ -0,0 +1,104 @@
+"""Tests for the Mastercard Settlement and Refund Splitter."""
+
+import pytest
+
+from kiroshi.storage.hacks.mastercard import _mastercard as hacks_mastercard
+
+
+class FakeBlobClient:
+    """Stand-in for a BlobClient that keeps uploads in memory."""
+
+    def __init__(self, blobs: dict[str, bytes], name: str) -> None:
+        """Initialize the FakeBlobClient class."""
+        self.blobs = blobs
+        self.name = name
+        self.staged: dict[str, bytes] = {}
+
+    def upload_blob(self, data: bytes, **kwargs: object) -> None:  # noqa: ARG002
+        """Store a blob uploaded in a single request."""
+        self.blobs[self.name] = bytes(data)
+
+    def stage_block(self, block_id: str, data: bytes) -> None:
+        """Store an uncommitted block."""
+        self.staged[block_id] = data
+
+    def commit_block_list(self, blocks: list, **kwargs: object) -> None:  # noqa: ARG002
+        """Store a blob from its staged blocks."""
+        self.blobs[self.name] = b"".join(self.staged[block.id] for block in blocks)
+
+
+class FakeBlobServiceClient:
+    """Stand-in for a BlobServiceClient that keeps uploads in memory."""
+
+    def __init__(self) -> None:
+        """Initialize the FakeBlobServiceClient class."""
+        self.blobs: dict[str, bytes] = {}
+
+    def get_blob_client(self, container: str, blob: str) -> FakeBlobClient:
+        """Return a client for a blob."""
+        return FakeBlobClient(self.blobs, f"{container}/{blob}")
+
+
+def record(spend: str) -> bytes:
+    """Return a data record with the given 12 character spend amount at offset 518."""
+    return b"D" + b"x" * 517 + spend.encode() + b"y" * 70
+
+
+HEADER = b"H" + b" " * 600
+TRAILER = b"T" + b" " * 100
+RECORDS = [HEADER, record("000000000100"), record("-00000000005"), record("+00000000007"), record("-00000000000"), TRAILER]
+SETTLEMENT = [HEADER, record("000000000100"), record("+00000000007"), record("-00000000000"), TRAILER]
+REFUND = [HEADER, record("-00000000005"), TRAILER]
+
+
+def split(content: bytes, block_size: int, upload_block_size: int = 8 * 1024 * 1024) -> tuple[bytes, bytes]:
+    """Split content read in blocks of block_size, returning the settlement and refund files."""
+    blob_client = FakeBlobServiceClient()
+    hacks_mastercard(
+        blob_client=blob_client,
+        blob_container="mastercard",
+        blob_directory="tgx2",
+        filename="file.txt",
+        blocks=(content[i : i + block_size] for i in range(0, len(content), block_size)),
+        block_size=upload_block_size,
+        block_concurrency=2,
+    )
+    return blob_client.blobs["mastercard/tgx2-settlement/file.txt"], blob_client.blobs["mastercard/tgx2-refund/file.txt"]
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 519, 600, 1 << 20])
+def test_lf(block_size: int) -> None:
+    """Test records are routed by the sign of their spend amount, wherever blocks split them."""
+    settlement, refund = split(b"\n".join(RECORDS) + b"\n", block_size)
+    assert settlement == b"\n".join(SETTLEMENT) + b"\n"  # noqa: S101
+    assert refund == b"\n".join(REFUND) + b"\n"  # noqa: S101
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 519, 600, 1 << 20])
+def test_crlf(block_size: int) -> None:
+    """Test CRLF line endings are written out as LF, including when a block ends between CR and LF."""
+    settlement, refund = split(b"\r\n".join(RECORDS) + b"\r\n", block_size)
+    assert settlement == b"\n".join(SETTLEMENT) + b"\n"  # noqa: S101
+    assert refund == b"\n".join(REFUND) + b"\n"  # noqa: S101
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1 << 20])
+def test_trailing_record_without_newline(block_size: int) -> None:
+    """Test a final record without a line ending is still routed and written without one."""
+    settlement, refund = split(b"\n".join([HEADER, record("000000000001"), record("-00000000001")]), block_size)
+    assert settlement == HEADER + b"\n" + record("000000000001") + b"\n"  # noqa: S101
+    assert refund == HEADER + b"\n" + record("-00000000001")  # noqa: S101
+
+
+def test_staged_uploads() -> None:
+    """Test output larger than an upload block is committed in order."""
+    records = [HEADER] + [record(f"{amount:+012d}") for amount in range(-500, 500)] + [TRAILER]
+    settlement, refund = split(b"\n".join(records) + b"\n", 4096, upload_block_size=1000)
+    assert settlement == b"\n".join([HEADER] + [record(f"{amount:+012d}") for amount in range(500)] + [TRAILER]) + b"\n"  # noqa: S101
+    assert refund == b"\n".join([HEADER] + [record(f"{amount:+012d}") for amount in range(-500, 0)] + [TRAILER]) + b"\n"  # noqa: S101
+
+
+def test_invalid_spend_amount() -> None:
+    """Test a data record without a numeric spend amount fails the file."""
+    with pytest.raises(ValueError, match="invalid literal"):
+        split(HEADER + b"\n" + record("not a number") + b"\n", 1 << 20)